@@ -2,8 +2,12 @@
 import time
 import hmac
 import hashlib
+import logging
 import httpx
 from urllib.parse import urlencode
+from app.tracing import traced
+
+logger = logging.getLogger(__name__)
 
 class BinanceClient:
     BASE_URL = "https://api.binance.com"
@@ -11,12 +15,25 @@ class BinanceClient:
     def __init__(self, api_key: str, api_secret: str):
         self.api_key = api_key
         self.api_secret = api_secret
+        # Server time minus local time, in ms; set by sync_time()
+        self.time_offset = 0
+        self._http = None
+
+    def _get_http(self) -> httpx.AsyncClient:
+        # One connection pool per client, so repeated calls reuse TCP/TLS connections
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(timeout=10)
+        return self._http
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
 
     def _get_headers(self) -> dict:
         return {"X-MBX-APIKEY": self.api_key}
 
     def _sign_params(self, params: dict) -> dict:
-        params["timestamp"] = int(time.time() * 1000)
+        params["timestamp"] = int(time.time() * 1000) + self.time_offset
         query_string = urlencode(params)
 
         signature = hmac.new(
@@ -27,17 +44,19 @@ class BinanceClient:
         params["signature"] = signature
         return params
 
+    @traced("binance.get_spot_price")
     async def get_spot_price(self, symbol: str) -> dict:
         """
         Get actual spot price for a provided symbol (for example, BTCUSDT).
         """
         url = f"{self.BASE_URL}/api/v3/ticker/price"
         params = {"symbol": symbol}
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params)
-            response.raise_for_status()
-            return response.json()
+        client = self._get_http()
+        response = await client.get(url, params=params)
+        response.raise_for_status()
+        return response.json()
 
+    @traced("binance.get_account_info")
     async def get_account_info(self) -> dict:
         """
         Get Account information, including all assets balances.
@@ -47,10 +66,10 @@ class BinanceClient:
         params = {}
         signed_params = self._sign_params(params)
         headers = self._get_headers()
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=signed_params, headers=headers)
-            response.raise_for_status()
-            return response.json()
+        client = self._get_http()
+        response = await client.get(url, params=signed_params, headers=headers)
+        response.raise_for_status()
+        return response.json()
 
     async def get_asset_balance(self, asset: str) -> float:
         """
@@ -62,6 +81,7 @@ class BinanceClient:
                 return float(balance["free"])
         return 0.0
 
+    @traced("binance.get_trade_history")
     async def get_trade_history(self, symbol: str) -> dict:
         """
         Get trading history for a provided asset symbol.
@@ -70,11 +90,12 @@ class BinanceClient:
         params = {"symbol": symbol}
         signed_params = self._sign_params(params)
         headers = self._get_headers()
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=signed_params, headers=headers)
-            response.raise_for_status()
-            return response.json()
+        client = self._get_http()
+        response = await client.get(url, params=signed_params, headers=headers)
+        response.raise_for_status()
+        return response.json()
 
+    @traced("binance.create_order")
     async def create_order(self, symbol: str, side: str, quantity: float, price: float, order_type: str = "LIMIT", timeInForce: str = "GTC") -> dict:
         """
         Create a new order.
@@ -91,15 +112,16 @@ class BinanceClient:
         # print(params["quantity"])
         signed_params = self._sign_params(params)
         headers = self._get_headers()
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, data=signed_params, headers=headers)
-            try:
-                response.raise_for_status()
-            except httpx.HTTPStatusError as exc:
-                print("Order creation error from Binance:", exc.response.text)
-                raise exc
-            return response.json()
+        client = self._get_http()
+        response = await client.post(url, data=signed_params, headers=headers)
+        try:
+            response.raise_for_status()
+        except httpx.HTTPStatusError as exc:
+            logger.error("Order creation error from Binance: %s", exc.response.text)
+            raise exc
+        return response.json()
 
+    @traced("binance.cancel_order")
     async def cancel_order(self, symbol: str, orderId: int) -> dict:
         """
         Canced the order by its id for a provided asset symbol.
@@ -108,18 +130,44 @@ class BinanceClient:
         params = {"symbol": symbol, "orderId": orderId}
         signed_params = self._sign_params(params)
         headers = self._get_headers()
-        async with httpx.AsyncClient() as client:
-            response = await client.delete(url, params=signed_params, headers=headers)
-            response.raise_for_status()
-            return response.json()
+        client = self._get_http()
+        response = await client.delete(url, params=signed_params, headers=headers)
+        response.raise_for_status()
+        return response.json()
 
-    async def get_exchange_info(self) -> dict:
+    @traced("binance.get_exchange_info")
+    async def get_exchange_info(self, symbol: str = None) -> dict:
         url = f"{self.BASE_URL}/api/v3/exchangeInfo"
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            response.raise_for_status()
-            return response.json()
+        params = {"symbol": symbol} if symbol else None
+        client = self._get_http()
+        response = await client.get(url, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def get_symbol_filters(self, symbol: str) -> dict:
+        """
+        Get trading filters (PRICE_FILTER, LOT_SIZE, NOTIONAL, ...) for a symbol, by filter type.
+        """
+        info = await self.get_exchange_info(symbol)
+        for symbol_info in info.get("symbols", []):
+            if symbol_info["symbol"] == symbol:
+                return {f["filterType"]: f for f in symbol_info.get("filters", [])}
+        return {}
 
+    @traced("binance.sync_time")
+    async def sync_time(self) -> int:
+        """
+        Measure the offset between Binance server time and local time, used when signing requests.
+        """
+        client = self._get_http()
+        sent = time.time() * 1000
+        response = await client.get(f"{self.BASE_URL}/api/v3/time")
+        response.raise_for_status()
+        received = time.time() * 1000
+        self.time_offset = int(response.json()["serverTime"] - (sent + received) / 2)
+        return self.time_offset
+
+    @traced("binance.get_order_status")
     async def get_order_status(self, symbol: str, orderId: int) -> dict:
         """
         Retrieves the status of an order.
@@ -128,7 +176,7 @@ class BinanceClient:
         params = {"symbol": symbol, "orderId": orderId}
         signed_params = self._sign_params(params)
         headers = self._get_headers()
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=signed_params, headers=headers)
-            response.raise_for_status()
-            return response.json()
+        client = self._get_http()
+        response = await client.get(url, params=signed_params, headers=headers)
+        response.raise_for_status()
+        return response.json()
@@ -1,5 +1,8 @@
+import logging
 import math
 
+logger = logging.getLogger(__name__)
+
 def calculate_grid_orders(
     market_price: float,
     offset_percent: float,
@@ -68,7 +71,7 @@ def calculate_grid_orders(
 
     # If total effective usage exceeds total_usdt, adjust the last order by reducing its asset quantity
     while total_effective > total_usdt and computed_orders[-1]["asset_quantity"] >= min_step:
-        print(total_effective)
+        logger.debug("Trimming last grid order, total effective usage: %s", total_effective)
         last_order = computed_orders[-1]
         # Reduce asset_quantity by min_step
         last_order["asset_quantity"] = round(last_order["asset_quantity"] - min_step, precision)
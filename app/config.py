@@ -1,7 +1,30 @@
 import os
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
 
 BINANCE_API_KEY = os.getenv("BINANCE_API_KEY")
 BINANCE_API_SECRET = os.getenv("BINANCE_API_SECRET")
+
+# Sharded deployment: every worker process runs with its own WORKER_ID and
+# WORKER_ADDRESS and points at the same coordination store.
+SHARD_BACKEND = os.getenv("SHARD_BACKEND", "memory")  # memory, sqlite or redis
+if SHARD_BACKEND.lower() != "memory" and (os.getenv("WORKER_ID") is None or os.getenv("WORKER_ADDRESS") is None):
+    # The defaults only fit a single worker: other workers would forward requests to their own 127.0.0.1
+    raise RuntimeError(f"SHARD_BACKEND={SHARD_BACKEND} requires WORKER_ID and WORKER_ADDRESS to be set for every worker")
+SHARD_URL = os.getenv("SHARD_URL", "dca_bot_shards.sqlite3")  # sqlite path or redis:// url
+WORKER_ID = os.getenv("WORKER_ID", f"{socket.gethostname()}-{os.getpid()}")
+WORKER_ADDRESS = os.getenv("WORKER_ADDRESS", "http://127.0.0.1:8000")
+LEASE_TTL = float(os.getenv("LEASE_TTL", "15"))
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_JSON = os.getenv("LOG_JSON", "0") == "1"  # one JSON object per log line
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))  # share of monitor ticks traced, 0..1
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+
+# Token for the /admin endpoints (profiler, task dump); they are disabled when unset.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+# SQLite file with the history of completed cycles
+HISTORY_DB = os.getenv("HISTORY_DB", "dca_bot_history.sqlite3")
@@ -0,0 +1,490 @@
+import asyncio
+import bisect
+from abc import ABC, abstractmethod
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # redis is only needed for the redis backend
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+
+class HashRing:
+    """
+    Consistent hash ring used to assign bots to worker processes.
+    """
+
+    def __init__(self, nodes=(), replicas: int = 64):
+        self.replicas = replicas
+        self._keys = []
+        self._nodes = {}
+        for node in nodes:
+            self.add_node(node)
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int(hashlib.md5(value.encode("utf-8")).hexdigest(), 16)
+
+    def add_node(self, node: str):
+        for i in range(self.replicas):
+            key = self._hash(f"{node}#{i}")
+            self._nodes[key] = node
+            bisect.insort(self._keys, key)
+
+    def get_node(self, key: str):
+        if not self._keys:
+            return None
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._nodes[self._keys[index]]
+
+
+class CoordinationStore(ABC):
+    """
+    Shared state for a sharded deployment: live workers, bot ownership leases
+    and the latest published snapshot of every bot.
+    """
+
+    @abstractmethod
+    async def heartbeat(self, worker_id: str, address: str, ttl: float):
+        pass
+
+    @abstractmethod
+    async def remove_worker(self, worker_id: str):
+        pass
+
+    @abstractmethod
+    async def live_workers(self) -> dict:
+        """
+        Returns {worker_id: address} for workers with an unexpired heartbeat.
+        """
+
+    @abstractmethod
+    async def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        """
+        Takes or renews the lease on key. Fails if another owner holds an unexpired lease.
+        """
+
+    @abstractmethod
+    async def release_lease(self, key: str, owner: str):
+        pass
+
+    @abstractmethod
+    async def get_lease_owner(self, key: str):
+        pass
+
+    @abstractmethod
+    async def put_snapshot(self, key: str, snapshot: dict):
+        pass
+
+    @abstractmethod
+    async def get_snapshot(self, key: str):
+        pass
+
+    @abstractmethod
+    async def list_snapshots(self) -> dict:
+        pass
+
+    @abstractmethod
+    async def delete_snapshot(self, key: str):
+        pass
+
+    async def close(self):
+        pass
+
+
+class InMemoryStore(CoordinationStore):
+    """
+    Process-local store, for running a single worker.
+    """
+
+    def __init__(self):
+        self.workers = {}
+        self.leases = {}
+        self.snapshots = {}
+
+    async def heartbeat(self, worker_id: str, address: str, ttl: float):
+        self.workers[worker_id] = (address, time.time() + ttl)
+
+    async def remove_worker(self, worker_id: str):
+        self.workers.pop(worker_id, None)
+
+    async def live_workers(self) -> dict:
+        now = time.time()
+        return {worker_id: address for worker_id, (address, expires_at) in self.workers.items() if expires_at > now}
+
+    async def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        current = self.leases.get(key)
+        if current is not None and current[0] != owner and current[1] > time.time():
+            return False
+        self.leases[key] = (owner, time.time() + ttl)
+        return True
+
+    async def release_lease(self, key: str, owner: str):
+        current = self.leases.get(key)
+        if current is not None and current[0] == owner:
+            del self.leases[key]
+
+    async def get_lease_owner(self, key: str):
+        current = self.leases.get(key)
+        if current is None or current[1] <= time.time():
+            return None
+        return current[0]
+
+    async def put_snapshot(self, key: str, snapshot: dict):
+        self.snapshots[key] = snapshot
+
+    async def get_snapshot(self, key: str):
+        return self.snapshots.get(key)
+
+    async def list_snapshots(self) -> dict:
+        return dict(self.snapshots)
+
+    async def delete_snapshot(self, key: str):
+        self.snapshots.pop(key, None)
+
+
+class SQLiteStore(CoordinationStore):
+    """
+    Store backed by a SQLite file, for several workers on one host.
+    Queries run in a worker thread so they do not block the event loop.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS workers (worker_id TEXT PRIMARY KEY, address TEXT, expires_at REAL);
+                CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT, expires_at REAL);
+                CREATE TABLE IF NOT EXISTS snapshots (key TEXT PRIMARY KEY, data TEXT, updated_at REAL);
+                """
+            )
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=10)
+
+    def _execute(self, query: str, params: tuple, fetch: bool):
+        conn = self._connect()
+        try:
+            with conn:
+                cursor = conn.execute(query, params)
+                return cursor.fetchall() if fetch else cursor.rowcount
+        finally:
+            conn.close()
+
+    async def _fetch(self, query: str, params: tuple = ()) -> list:
+        return await asyncio.to_thread(self._execute, query, params, True)
+
+    async def _write(self, query: str, params: tuple = ()) -> int:
+        return await asyncio.to_thread(self._execute, query, params, False)
+
+    async def heartbeat(self, worker_id: str, address: str, ttl: float):
+        await self._write(
+            "INSERT INTO workers (worker_id, address, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(worker_id) DO UPDATE SET address = excluded.address, expires_at = excluded.expires_at",
+            (worker_id, address, time.time() + ttl),
+        )
+
+    async def remove_worker(self, worker_id: str):
+        await self._write("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+
+    async def live_workers(self) -> dict:
+        rows = await self._fetch("SELECT worker_id, address FROM workers WHERE expires_at > ?", (time.time(),))
+        return {row[0]: row[1] for row in rows}
+
+    async def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        updated = await self._write(
+            "INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+            "WHERE leases.owner = excluded.owner OR leases.expires_at <= ?",
+            (key, owner, now + ttl, now),
+        )
+        return updated == 1
+
+    async def release_lease(self, key: str, owner: str):
+        await self._write("DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner))
+
+    async def get_lease_owner(self, key: str):
+        rows = await self._fetch("SELECT owner FROM leases WHERE key = ? AND expires_at > ?", (key, time.time()))
+        return rows[0][0] if rows else None
+
+    async def put_snapshot(self, key: str, snapshot: dict):
+        await self._write(
+            "INSERT INTO snapshots (key, data, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+            (key, json.dumps(snapshot), time.time()),
+        )
+
+    async def get_snapshot(self, key: str):
+        rows = await self._fetch("SELECT data FROM snapshots WHERE key = ?", (key,))
+        return json.loads(rows[0][0]) if rows else None
+
+    async def list_snapshots(self) -> dict:
+        rows = await self._fetch("SELECT key, data FROM snapshots")
+        return {row[0]: json.loads(row[1]) for row in rows}
+
+    async def delete_snapshot(self, key: str):
+        await self._write("DELETE FROM snapshots WHERE key = ?", (key,))
+
+
+class RedisStore(CoordinationStore):
+    """
+    Store backed by Redis (or any Redis-compatible server), for workers on several hosts.
+    """
+
+    PREFIX = "dca_bot"
+
+    # Take the lease if it is free or already ours, in one round trip.
+    ACQUIRE_SCRIPT = """
+    local current = redis.call('GET', KEYS[1])
+    if not current or current == ARGV[1] then
+        redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+        return 1
+    end
+    return 0
+    """
+
+    RELEASE_SCRIPT = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, url: str):
+        if aioredis is None:
+            raise RuntimeError("Для SHARD_BACKEND=redis необходимо установить пакет redis")
+        self.redis = aioredis.from_url(url, decode_responses=True)
+        self._acquire = self.redis.register_script(self.ACQUIRE_SCRIPT)
+        self._release = self.redis.register_script(self.RELEASE_SCRIPT)
+
+    def _key(self, *parts: str) -> str:
+        return ":".join((self.PREFIX,) + parts)
+
+    async def heartbeat(self, worker_id: str, address: str, ttl: float):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zadd(self._key("workers"), {worker_id: time.time() + ttl})
+            pipe.hset(self._key("worker_addresses"), worker_id, address)
+            await pipe.execute()
+
+    async def remove_worker(self, worker_id: str):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zrem(self._key("workers"), worker_id)
+            pipe.hdel(self._key("worker_addresses"), worker_id)
+            await pipe.execute()
+
+    async def live_workers(self) -> dict:
+        worker_ids = await self.redis.zrangebyscore(self._key("workers"), time.time(), "+inf")
+        if not worker_ids:
+            return {}
+        addresses = await self.redis.hmget(self._key("worker_addresses"), worker_ids)
+        return {worker_id: address for worker_id, address in zip(worker_ids, addresses) if address}
+
+    async def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        result = await self._acquire(keys=[self._key("lease", key)], args=[owner, int(ttl * 1000)])
+        return result == 1
+
+    async def release_lease(self, key: str, owner: str):
+        await self._release(keys=[self._key("lease", key)], args=[owner])
+
+    async def get_lease_owner(self, key: str):
+        return await self.redis.get(self._key("lease", key))
+
+    async def put_snapshot(self, key: str, snapshot: dict):
+        await self.redis.hset(self._key("snapshots"), key, json.dumps(snapshot))
+
+    async def get_snapshot(self, key: str):
+        data = await self.redis.hget(self._key("snapshots"), key)
+        return json.loads(data) if data else None
+
+    async def list_snapshots(self) -> dict:
+        data = await self.redis.hgetall(self._key("snapshots"))
+        return {key: json.loads(value) for key, value in data.items()}
+
+    async def delete_snapshot(self, key: str):
+        await self.redis.hdel(self._key("snapshots"), key)
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def create_store(backend: str, url: str) -> CoordinationStore:
+    backend = backend.lower()
+    if backend == "memory":
+        return InMemoryStore()
+    if backend == "sqlite":
+        return SQLiteStore(url)
+    if backend == "redis":
+        return RedisStore(url)
+    raise ValueError(f"Unknown coordination backend: {backend}")
+
+
+class ShardCoordinator:
+    """
+    Keeps this worker registered in the store, holds the leases of the bots it runs
+    and publishes their snapshots. Bots are assigned to workers on a consistent hash ring.
+    """
+
+    def __init__(self, store: CoordinationStore, worker_id: str, address: str, bots: dict, lease_ttl: float,
+                 on_drop=None):
+        self.store = store
+        self.worker_id = worker_id
+        self.address = address
+        self.bots = bots
+        self.lease_ttl = lease_ttl
+        # Coroutine function awaited with the bot_id of every dropped bot before its orders are cancelled
+        self.on_drop = on_drop
+        self.task = None
+        # Shutdown tasks of dropped bots, referenced until they finish
+        self._shutdowns = set()
+        # Time of the last successful lease renewal, by bot_id
+        self._renewed_at = {}
+        self._ring = HashRing()
+        self._ring_nodes = frozenset()
+
+    def _get_ring(self, workers: dict) -> HashRing:
+        nodes = frozenset(workers)
+        if nodes != self._ring_nodes:
+            self._ring = HashRing(sorted(nodes))
+            self._ring_nodes = nodes
+        return self._ring
+
+    async def owner_of(self, bot_id: str) -> tuple:
+        """
+        Returns (worker_id, address) of the worker that runs or should run the bot.
+        A live lease holder wins over the hash ring, so bots do not move when workers join.
+        A lease held by a worker without a live heartbeat is ignored.
+        """
+        workers = await self.store.live_workers()
+        owner = await self.store.get_lease_owner(bot_id)
+        if owner not in workers:
+            owner = self._get_ring(workers).get_node(bot_id)
+        if owner is None:
+            return self.worker_id, self.address
+        return owner, workers[owner]
+
+    def is_local(self, worker_id: str) -> bool:
+        return worker_id == self.worker_id
+
+    async def acquire(self, bot_id: str) -> bool:
+        acquired = await self.store.acquire_lease(bot_id, self.worker_id, self.lease_ttl)
+        if acquired:
+            self._renewed_at[bot_id] = time.time()
+        return acquired
+
+    async def release(self, bot_id: str):
+        await self.store.release_lease(bot_id, self.worker_id)
+
+    async def forget(self, bot_id: str):
+        """
+        Drops the lease and snapshot of a bot that failed to start.
+        """
+        await self.release(bot_id)
+        await self.store.delete_snapshot(bot_id)
+
+    async def is_live_worker(self, worker_id: str) -> bool:
+        return worker_id in await self.store.live_workers()
+
+    async def live_snapshots(self) -> dict:
+        """
+        Snapshots of bots whose worker is still alive; stale ones from dead workers are skipped.
+        """
+        workers = await self.store.live_workers()
+        snapshots = await self.store.list_snapshots()
+        return {key: snapshot for key, snapshot in snapshots.items() if snapshot.get("worker_id") in workers}
+
+    async def publish(self, bot_id: str, bot):
+        snapshot = bot.snapshot()
+        snapshot["worker_id"] = self.worker_id
+        snapshot["updated_at"] = time.time()
+        await self.store.put_snapshot(bot_id, snapshot)
+
+    async def start(self):
+        await self.store.heartbeat(self.worker_id, self.address, self.lease_ttl)
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+        for bot_id in list(self.bots):
+            try:
+                await self.forget(bot_id)
+            except Exception as e:
+                logger.error("Error releasing lease for bot %s: %s", bot_id, e)
+        await self.store.remove_worker(self.worker_id)
+        await self.store.close()
+
+    async def _shutdown_bot(self, bot_id: str, bot):
+        """
+        Waits for the bot's monitor and on_drop to stop, then cancels its orders and closes its client.
+        """
+        if self.on_drop is not None:
+            try:
+                await self.on_drop(bot_id)
+            except Exception as e:
+                logger.error("Error in drop handler for bot %s: %s", bot_id, e)
+        if bot.monitor_task is not None:
+            await asyncio.gather(bot.monitor_task, return_exceptions=True)
+        try:
+            await bot.cancel_all_orders()
+            logger.critical("Orders of dropped bot %s cancelled", bot_id)
+        except Exception as e:
+            logger.critical("Error cancelling orders of dropped bot %s, cancel them manually: %s", bot_id, e)
+        finally:
+            await bot.client.aclose()
+
+    def _drop_bot(self, bot_id: str, bot):
+        """
+        Stops a bot whose lease this worker no longer holds, so it never trades twice.
+        Its orders are cancelled in the background, since no worker watches them any more.
+        """
+        logger.critical("Bot %s lost its lease, stopping it and cancelling its orders", bot_id)
+        self.bots.pop(bot_id, None)
+        self._renewed_at.pop(bot_id, None)
+        if bot.monitor_task is not None:
+            bot.monitor_task.cancel()
+        task = asyncio.create_task(self._shutdown_bot(bot_id, bot), name=f"drop:{bot_id}")
+        self._shutdowns.add(task)
+        task.add_done_callback(self._shutdowns.discard)
+
+    async def _renew(self, bot_id: str, bot):
+        try:
+            renewed = await self.acquire(bot_id)
+        except Exception as e:
+            logger.error("Error renewing lease for bot %s: %s", bot_id, e)
+            # The lease may have expired in the store while it was unreachable
+            renewed_at = self._renewed_at.setdefault(bot_id, time.time())
+            if time.time() - renewed_at < self.lease_ttl:
+                return
+            logger.error("Lease for bot %s was not renewed for %s s, stopping the bot", bot_id, self.lease_ttl)
+            self._drop_bot(bot_id, bot)
+            return
+        if not renewed:
+            logger.error("Lease for bot %s is held by another worker, stopping the bot", bot_id)
+            self._drop_bot(bot_id, bot)
+            return
+        self._renewed_at[bot_id] = time.time()
+        await self.publish(bot_id, bot)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            try:
+                await self.store.heartbeat(self.worker_id, self.address, self.lease_ttl)
+            except Exception as e:
+                logger.error("Error sending worker heartbeat: %s", e)
+            for bot_id, bot in list(self.bots.items()):
+                try:
+                    await self._renew(bot_id, bot)
+                except Exception as e:
+                    logger.error("Error publishing snapshot for bot %s: %s", bot_id, e)
@@ -0,0 +1,171 @@
+import asyncio
+import calendar
+import sqlite3
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cycles (
+    id INTEGER PRIMARY KEY,
+    bot_id TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    ended_at REAL NOT NULL,
+    fills INTEGER NOT NULL,
+    avg_price REAL NOT NULL,
+    fixing_price REAL NOT NULL,
+    income REAL NOT NULL,
+    commission REAL NOT NULL,
+    profit REAL NOT NULL,
+    leftover_asset REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cycles_bot_ended ON cycles (bot_id, ended_at);
+
+-- Per-day rollup, updated in the same transaction as every insert into cycles
+CREATE TABLE IF NOT EXISTS cycle_daily (
+    bot_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    cycles INTEGER NOT NULL,
+    fills INTEGER NOT NULL,
+    income REAL NOT NULL,
+    commission REAL NOT NULL,
+    profit REAL NOT NULL,
+    leftover_asset REAL NOT NULL,
+    duration_sum REAL NOT NULL,
+    PRIMARY KEY (bot_id, day)
+);
+"""
+
+CYCLE_COLUMNS = (
+    "bot_id", "symbol", "started_at", "ended_at", "fills", "avg_price",
+    "fixing_price", "income", "commission", "profit", "leftover_asset",
+)
+
+DAILY_COLUMNS = ("day", "cycles", "fills", "income", "commission", "profit", "leftover_asset", "duration_sum")
+
+
+def day_of(timestamp: float) -> str:
+    """
+    UTC day (YYYY-MM-DD) a cycle is rolled up into.
+    """
+    return time.strftime("%Y-%m-%d", time.gmtime(timestamp))
+
+
+def normalize_day(day: str) -> str:
+    """
+    Canonical YYYY-MM-DD form of a day, so days compare correctly as text.
+    Raises ValueError on malformed input.
+    """
+    return time.strftime("%Y-%m-%d", time.strptime(day, "%Y-%m-%d"))
+
+
+def day_range(start_day: str = None, end_day: str = None) -> tuple:
+    """
+    Timestamps [start, end) covering the UTC days start_day..end_day; None ends stay unbounded.
+    """
+    start = calendar.timegm(time.strptime(start_day, "%Y-%m-%d")) if start_day is not None else 0
+    end = calendar.timegm(time.strptime(end_day, "%Y-%m-%d")) + 86400 if end_day is not None else None
+    return start, end
+
+
+class CycleHistory:
+    """
+    Append-only SQLite store of completed cycles with a per-day rollup for range queries.
+    Queries run in a worker thread so they do not block the event loop.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=10)
+
+    def _append(self, cycle: dict):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    f"INSERT INTO cycles ({', '.join(CYCLE_COLUMNS)}) VALUES ({', '.join('?' * len(CYCLE_COLUMNS))})",
+                    tuple(cycle[column] for column in CYCLE_COLUMNS),
+                )
+                conn.execute(
+                    "INSERT INTO cycle_daily (bot_id, day, cycles, fills, income, commission, profit, leftover_asset, duration_sum) "
+                    "VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(bot_id, day) DO UPDATE SET "
+                    "cycles = cycles + 1, fills = fills + excluded.fills, income = income + excluded.income, "
+                    "commission = commission + excluded.commission, profit = profit + excluded.profit, "
+                    "leftover_asset = leftover_asset + excluded.leftover_asset, duration_sum = duration_sum + excluded.duration_sum",
+                    (
+                        cycle["bot_id"], day_of(cycle["ended_at"]), cycle["fills"], cycle["income"],
+                        cycle["commission"], cycle["profit"], cycle["leftover_asset"],
+                        cycle["ended_at"] - cycle["started_at"],
+                    ),
+                )
+        finally:
+            conn.close()
+
+    def _fetch(self, query: str, params: tuple) -> list:
+        conn = self._connect()
+        try:
+            return conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+
+    async def append(self, cycle: dict):
+        """
+        Records a completed cycle; cycle holds every key of CYCLE_COLUMNS.
+        """
+        await asyncio.to_thread(self._append, cycle)
+
+    async def cycles(self, bot_id: str, start: float = 0, end: float = None, limit: int = 1000) -> list:
+        """
+        Raw cycles that ended in [start, end), newest first.
+        """
+        rows = await asyncio.to_thread(
+            self._fetch,
+            f"SELECT {', '.join(CYCLE_COLUMNS)} FROM cycles WHERE bot_id = ? AND ended_at >= ? AND ended_at < ? "
+            "ORDER BY ended_at DESC LIMIT ?",
+            (bot_id, start, end if end is not None else float("inf"), limit),
+        )
+        return [dict(zip(CYCLE_COLUMNS, row)) for row in rows]
+
+    async def daily(self, bot_id: str, start_day: str = None, end_day: str = None) -> list:
+        """
+        Per-day rollup rows for days in [start_day, end_day] (YYYY-MM-DD, UTC, see normalize_day).
+        """
+        rows = await asyncio.to_thread(
+            self._fetch,
+            f"SELECT {', '.join(DAILY_COLUMNS)} FROM cycle_daily WHERE bot_id = ? AND day >= ? AND day <= ? ORDER BY day",
+            (bot_id, start_day or "0000-00-00", end_day or "9999-99-99"),
+        )
+        return [dict(zip(DAILY_COLUMNS, row)) for row in rows]
+
+    async def summary(self, bot_id: str, start_day: str = None, end_day: str = None) -> dict:
+        """
+        Totals and averages over the days in [start_day, end_day], computed from the rollup.
+        """
+        rows = await asyncio.to_thread(
+            self._fetch,
+            "SELECT COUNT(*), SUM(cycles), SUM(fills), SUM(income), SUM(commission), SUM(profit), "
+            "SUM(leftover_asset), SUM(duration_sum) FROM cycle_daily WHERE bot_id = ? AND day >= ? AND day <= ?",
+            (bot_id, start_day or "0000-00-00", end_day or "9999-99-99"),
+        )
+        days, cycles, fills, income, commission, profit, leftover_asset, duration_sum = rows[0]
+        cycles = cycles or 0
+        return {
+            "active_days": days,
+            "cycles": cycles,
+            "fills": fills or 0,
+            "income": income or 0.0,
+            "commission": commission or 0.0,
+            "profit": profit or 0.0,
+            "leftover_asset": leftover_asset or 0.0,
+            "profit_per_active_day": profit / days if days else None,
+            "avg_cycle_duration": duration_sum / cycles if cycles else None,
+            "avg_fills_per_cycle": fills / cycles if cycles else None,
+        }
@@ -0,0 +1,79 @@
+import json
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+logger = logging.getLogger(__name__)
+
+# Attributes every LogRecord has; anything else was passed through `extra`.
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Puts records on the queue unformatted, so message formatting
+    happens on the listener thread instead of the event loop.
+    Dict, list and set arguments are copied shallowly first, so later changes by the
+    caller do not show up in the message; objects nested inside them are not copied.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        if isinstance(args, dict):
+            # A single mapping argument, for %(name)s style messages
+            record.args = _snapshot(args)
+        elif args:
+            record.args = tuple(_snapshot(arg) for arg in args)
+        return record
+
+
+def _snapshot(value):
+    if isinstance(value, (dict, list, set)):
+        return value.copy()
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, including fields passed through `extra`.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+def setup_logging(level="INFO", json_format: bool = False) -> QueueListener:
+    """
+    Routes all logging through a queue drained by a background thread.
+    level is a level number or name; an unknown name falls back to INFO with a warning.
+    Returns the started listener; stop it on shutdown to flush pending records.
+    """
+    numeric_level = logging.getLevelName(level.upper()) if isinstance(level, str) else level
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if json_format else logging.Formatter(LOG_FORMAT))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(LazyQueueHandler(log_queue))
+    root.setLevel(numeric_level if isinstance(numeric_level, int) else logging.INFO)
+
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    if not isinstance(numeric_level, int):
+        logger.warning("Unknown log level %r, using INFO", level)
+    return listener
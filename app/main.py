@@ -1,27 +1,127 @@
-from fastapi import FastAPI, Form, Request
-from fastapi.responses import HTMLResponse
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, Form, Header, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response
 from fastapi.templating import Jinja2Templates
 from app.models import APIKeys, TradingSettings
 from pydantic import ValidationError
 from app.binance import BinanceClient
 from app.calc import calculate_grid_orders
 from app.trading_bot import TradingBot
+from app.setup_jobs import SetupJob, place_grid_job, run_preflight
+from app.coordination import ShardCoordinator, create_store
+from app.config import SHARD_BACKEND, SHARD_URL, WORKER_ID, WORKER_ADDRESS, LEASE_TTL
+from app.config import LOG_LEVEL, LOG_JSON, TRACE_SAMPLE_RATE, TRACE_FILE, ADMIN_TOKEN, HISTORY_DB
+from app.history import CycleHistory, day_range, normalize_day
+from app.logging_config import setup_logging
+from app import tracing
+from app import profiler
 import asyncio
+import hashlib
+import hmac
+import httpx
 
 import logging
 
-current_bot = None
+# Bots hosted by this worker process, by bot_id
+bots = {}
 bot_lock = asyncio.Lock()
+# Grid placement jobs by bot_id, and bot ids whose setup is still in pre-flight
+setup_jobs = {}
+pending_setups = set()
 
+# Set on requests forwarded from another worker, so they are never forwarded again
+FORWARDED_HEADER = "X-DCA-Forwarded-By"
 
-logging.basicConfig(
-    level=logging.INFO, 
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+logger = logging.getLogger(__name__)
+
+log_listener = setup_logging(level=LOG_LEVEL, json_format=LOG_JSON)
+tracing.configure(TRACE_SAMPLE_RATE, TRACE_FILE)
+
+cycle_history = CycleHistory(HISTORY_DB)
+
+
+async def stop_setup_job(bot_id: str):
+    """
+    Fails the setup job of a bot dropped by the coordinator, so it is not reported as running.
+    """
+    job = setup_jobs.get(bot_id)
+    if job is not None:
+        await job.stop("Бот остановлен: аренда бота потеряна")
+
+
+coordinator = ShardCoordinator(
+    store=create_store(SHARD_BACKEND, SHARD_URL),
+    worker_id=WORKER_ID,
+    address=WORKER_ADDRESS,
+    bots=bots,
+    lease_ttl=LEASE_TTL,
+    on_drop=stop_setup_job,
 )
 
-app = FastAPI(title="Trading Bot Setup")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await coordinator.start()
+    yield
+    await coordinator.stop()
+    if tracing.tracer.exporter is not None:
+        tracing.tracer.exporter.stop()
+    log_listener.stop()
+
+
+app = FastAPI(title="Trading Bot Setup", lifespan=lifespan)
 templates = Jinja2Templates(directory="templates")
 
+def make_bot_id(api_key: str, trading_pair: str) -> str:
+    """
+    Stable bot id: one bot per API key and trading pair.
+    """
+    digest = hashlib.sha256(f"{api_key}:{trading_pair}".encode("utf-8")).hexdigest()[:16]
+    return f"{trading_pair.replace('/', '')}-{digest}"
+
+
+async def forward_to_shard(request: Request, address: str, params: Optional[dict] = None) -> Response:
+    """
+    Proxies the request to the worker that owns the bot.
+    """
+    data = dict(await request.form()) if request.method == "POST" else None
+    headers = {FORWARDED_HEADER: coordinator.worker_id}
+    try:
+        async with httpx.AsyncClient(timeout=60) as client:
+            response = await client.request(
+                request.method,
+                address.rstrip("/") + request.url.path,
+                params=params if params is not None else request.query_params,
+                data=data,
+                headers=headers,
+            )
+    except httpx.HTTPError as e:
+        return HTMLResponse(f"<h1>Воркер {address} недоступен: {e}</h1>", status_code=502)
+    return Response(
+        content=response.content,
+        status_code=response.status_code,
+        media_type=response.headers.get("content-type"),
+    )
+
+
+async def resolve_owner(request: Request, bot_id: str):
+    """
+    Returns the address of the worker owning bot_id, or None if the bot belongs to this worker.
+    """
+    forwarded_by = request.headers.get(FORWARDED_HEADER)
+    if forwarded_by is not None and await coordinator.is_live_worker(forwarded_by):
+        return None
+    if bot_id in bots:
+        # Bots whose lease is lost are removed from bots by the coordinator
+        return None
+    owner, address = await coordinator.owner_of(bot_id)
+    if coordinator.is_local(owner):
+        return None
+    return address
+
+
 @app.get("/", response_class=HTMLResponse)
 async def setup_form(request: Request):
     return templates.TemplateResponse("setup.html", {"request": request})
@@ -40,61 +140,101 @@ async def submit_setup(
     reposition_threshold_percent: float = Form(...),
     profit_percent: float = Form(...),
 ):
-    client = BinanceClient(api_key=api_key, api_secret=api_secret)
-    try:
-        balance = await client.get_asset_balance("USDT")
-    except Exception as ex:
-        return HTMLResponse(f"Ошибка получения баланса: {ex}", status_code=500)
+    bot_id = make_bot_id(api_key, trading_pair)
+    owner_address = await resolve_owner(request, bot_id)
+    if owner_address is not None:
+        return await forward_to_shard(request, owner_address)
 
-    if balance < usdt_amount:
-        return HTMLResponse(
-            f"Недостаточно средств для торговли. Ваш баланс USDT: {balance}, требуется: {usdt_amount}",
-            status_code=400,
-        )
-
-    global current_bot
     async with bot_lock:
-        if current_bot is not None:
+        job = setup_jobs.get(bot_id)
+        if bot_id in bots or bot_id in pending_setups or (job is not None and job.active) or not await coordinator.acquire(bot_id):
             return HTMLResponse("<h1>Бот уже создан</h1>", status_code=400)
+        pending_setups.add(bot_id)
+
+    client = BinanceClient(api_key=api_key, api_secret=api_secret)
+    try:
+        try:
+            balance, market_price, filters = await run_preflight(client, trading_pair.replace("/", ""))
+        except Exception as ex:
+            return HTMLResponse(f"Ошибка предварительной проверки: {ex}", status_code=500)
+
+        if balance < usdt_amount:
+            return HTMLResponse(
+                f"Недостаточно средств для торговли. Ваш баланс USDT: {balance}, требуется: {usdt_amount}",
+                status_code=400,
+            )
 
-        current_bot = TradingBot(api_key, api_secret, trading_pair, reposition_threshold_percent)
+        bot = TradingBot(api_key, api_secret, trading_pair, reposition_threshold_percent, bot_id=bot_id, client=client, history=cycle_history)
         try:
-            result = await current_bot.start_cycle(
+            grid_orders = bot.prepare_cycle(
+                market_price=market_price,
                 usdt_amount=usdt_amount,
                 grid_length_percent=grid_length_percent,
                 first_order_offset_percent=first_order_offset_percent,
                 num_grid_orders=num_grid_orders,
                 increase_percent=percent_increase,
-                profit_percent=profit_percent
+                profit_percent=profit_percent,
+                filters=filters
             )
         except Exception as e:
-            current_bot = None
-            return HTMLResponse(f"<h1>Ошибка запуска цикла: {e}</h1>", status_code=500)
-    
-    # Return immediately that the grid is placed and monitoring is running.
-    orders_html = "<table border='1' cellpadding='5' cellspacing='0'><tr><th>№</th><th>Цена</th><th>Выделение USDT</th><th>Количество актива</th><th>Order ID</th><th>Статус</th></tr>"
-    for order in result["placed_orders"]:
-        orders_html += f"""
-            <tr>
-                <td>{order['order_number']}</td>
-                <td>{order['price']:.2f}</td>
-                <td>{order['usdt_allocation']:.7f}</td>
-                <td>{order['asset_quantity']:.5f}</td>
-                <td>{order.get('order_id', 'N/A')}</td>
-                <td>{order.get('status', 'N/A')}</td>
-            </tr>
-        """
-    orders_html += "</table>"
-    
-    return HTMLResponse(
-        f"<h1>{result['message']}</h1>"
-        f"<p>Рыночная цена: {result['market_price']:.2f}</p>"
-        f"{orders_html}"
-        f"<br><a href='/setup'>Вернуться к настройкам</a>"
+            return HTMLResponse(f"<h1>Ошибка запуска цикла: {e}</h1>", status_code=400)
+
+        job = SetupJob(bot_id, len(grid_orders), market_price)
+        setup_jobs[bot_id] = job
+        bots[bot_id] = bot
+        job.task = asyncio.create_task(place_grid_job(job, bot, grid_orders, bots, coordinator), name=f"setup:{bot_id}")
+    finally:
+        pending_setups.discard(bot_id)
+        if bot_id not in bots:
+            await client.aclose()
+            await coordinator.forget(bot_id)
+
+    # Return immediately; the page polls the job for placement progress.
+    return templates.TemplateResponse(
+        "setup_job.html",
+        {"request": request, "bot_id": bot_id, "market_price": market_price, "total_orders": len(grid_orders)},
     )
 
+@app.get("/setup/jobs/{bot_id}")
+async def setup_job_status(request: Request, bot_id: str):
+    owner_address = await resolve_owner(request, bot_id)
+    if owner_address is not None:
+        return await forward_to_shard(request, owner_address)
+    job = setup_jobs.get(bot_id)
+    if job is None:
+        return JSONResponse({"detail": "Задача не найдена"}, status_code=404)
+    return JSONResponse(job.to_dict())
+
+@app.get("/bots")
+async def list_bots():
+    """
+    Latest snapshots of all bots across every live worker.
+    """
+    return JSONResponse(await coordinator.live_snapshots())
+
 @app.get("/stats", response_class=HTMLResponse)
-async def stats(request: Request):
+async def stats(request: Request, bot_id: Optional[str] = None):
+    with tracing.tracer.trace("stats", bot_id=bot_id):
+        return await render_stats(request, bot_id)
+
+async def render_stats(request: Request, bot_id: Optional[str]):
+    if bot_id is None:
+        snapshots = await coordinator.live_snapshots()
+        if len(snapshots) != 1:
+            if not snapshots:
+                return HTMLResponse("<h1>Бот не запущен</h1>")
+            links = "".join(
+                f"<li><a href='/stats?bot_id={key}'>{key}</a> ({snapshot.get('symbol')})</li>"
+                for key, snapshot in snapshots.items()
+            )
+            return HTMLResponse(f"<h1>Боты</h1><ul>{links}</ul>")
+        bot_id = next(iter(snapshots))
+
+    owner_address = await resolve_owner(request, bot_id)
+    if owner_address is not None:
+        return await forward_to_shard(request, owner_address, params={"bot_id": bot_id})
+
+    current_bot = bots.get(bot_id)
     if current_bot is None:
         return HTMLResponse("<h1>Бот не запущен</h1>")
 
@@ -161,6 +301,15 @@ async def stats(request: Request):
     else:
         html += f"<p><strong>Остаток актива (в USDT):</strong> N/A (не удалось получить рыночную цену)</p>"
     
+    summary = await cycle_history.summary(bot_id)
+    html += "<h2>История циклов</h2>"
+    if summary["cycles"]:
+        html += f"<p><strong>Средняя длительность цикла (мин):</strong> {summary['avg_cycle_duration'] / 60:.1f}</p>"
+        html += f"<p><strong>Среднее число исполненных ордеров за цикл:</strong> {summary['avg_fills_per_cycle']:.2f}</p>"
+        html += f"<p><strong>Средняя прибыль за день с циклами (USDT):</strong> {summary['profit_per_active_day']:.2f}</p>"
+        html += f"<p><strong>Комиссия (USDT):</strong> {summary['commission']:.4f}</p>"
+    html += f"<p><a href='/stats/history?bot_id={bot_id}'>История по дням (JSON)</a></p>"
+
     html += "<h2>Текущее состояние открытого цикла</h2>"
     html += f"<p><strong>Исполненных ордеров на покупку:</strong> {num_filled}</p>"
     if avg_purchase_price is not None:
@@ -183,6 +332,109 @@ async def stats(request: Request):
     return HTMLResponse(html)
 
 
+@app.get("/stats/history")
+async def stats_history(
+    request: Request,
+    bot_id: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    cycles: bool = False,
+    limit: int = Query(1000, ge=1, le=10000),
+):
+    """
+    Cycle history over the days in [start, end] (YYYY-MM-DD, UTC): summary and per-day rollup,
+    and with cycles=true the individual cycles.
+    """
+    try:
+        start = normalize_day(start) if start is not None else None
+        end = normalize_day(end) if end is not None else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start и end должны быть в формате YYYY-MM-DD")
+    if start is not None and end is not None and start > end:
+        raise HTTPException(status_code=400, detail="start не может быть позже end")
+
+    owner_address = await resolve_owner(request, bot_id)
+    if owner_address is not None:
+        return await forward_to_shard(request, owner_address)
+    result = {
+        "bot_id": bot_id,
+        "summary": await cycle_history.summary(bot_id, start, end),
+        "daily": await cycle_history.daily(bot_id, start, end),
+    }
+    if cycles:
+        start_ts, end_ts = day_range(start, end)
+        result["cycles"] = await cycle_history.cycles(bot_id, start_ts, end_ts, limit)
+    return JSONResponse(result)
+
+
+def check_admin_token(token: Optional[str]):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404)
+    if token is None or not hmac.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Неверный токен администратора")
+
+def check_profile_window(seconds: float):
+    if not 0 < seconds <= profiler.MAX_PROFILE_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds должен быть в диапазоне (0, {profiler.MAX_PROFILE_SECONDS}]")
+    if profiler.profile_lock.locked():
+        raise HTTPException(status_code=409, detail="Профилирование уже выполняется")
+
+@app.post("/admin/profile")
+async def admin_profile(
+    seconds: float = 10,
+    format: str = "collapsed",
+    interval_ms: float = 5,
+    x_admin_token: Optional[str] = Header(None),
+):
+    """
+    Profiles this worker's event loop for a bounded window.
+    format=collapsed: sampled stacks for flamegraph.pl / speedscope,
+    format=pstats: cProfile dump for pstats / snakeviz.
+    """
+    check_admin_token(x_admin_token)
+    check_profile_window(seconds)
+    if format not in ("collapsed", "pstats"):
+        raise HTTPException(status_code=400, detail="format должен быть collapsed или pstats")
+    async with profiler.profile_lock:
+        if format == "pstats":
+            data = await profiler.profile_pstats(seconds)
+            return Response(
+                content=data,
+                media_type="application/octet-stream",
+                headers={"Content-Disposition": f"attachment; filename={coordinator.worker_id}.prof"},
+            )
+        collapsed = await profiler.sample_stacks(seconds, max(interval_ms, 1) / 1000)
+    return PlainTextResponse(
+        collapsed,
+        headers={"Content-Disposition": f"attachment; filename={coordinator.worker_id}.collapsed"},
+    )
+
+@app.post("/admin/slow-calls")
+async def admin_slow_calls(
+    seconds: float = 10,
+    threshold_ms: float = 100,
+    x_admin_token: Optional[str] = Header(None),
+):
+    """
+    Reports monitor ticks, Binance calls and /stats renders slower than threshold_ms
+    during the window, and the event loop lag.
+    """
+    check_admin_token(x_admin_token)
+    check_profile_window(seconds)
+    async with profiler.profile_lock:
+        report = await profiler.detect_slow_calls(seconds, threshold_ms)
+    report["worker_id"] = coordinator.worker_id
+    return JSONResponse(report)
+
+@app.get("/admin/tasks")
+async def admin_tasks(x_admin_token: Optional[str] = Header(None)):
+    """
+    Pending asyncio tasks of this worker; bot monitors are named monitor:<bot_id>.
+    """
+    check_admin_token(x_admin_token)
+    return JSONResponse({"worker_id": coordinator.worker_id, "tasks": profiler.dump_tasks()})
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
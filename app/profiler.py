@@ -0,0 +1,149 @@
+import asyncio
+import cProfile
+import marshal
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from app.tracing import tracer
+
+MAX_PROFILE_SECONDS = 60
+
+# Only one profiling window may be open at a time.
+profile_lock = asyncio.Lock()
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_qualname}"
+
+
+class StackSampler:
+    """
+    Samples the stack of one thread (the event loop) from a background thread
+    and aggregates it in the collapsed format used by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+
+async def sample_stacks(seconds: float, interval: float) -> str:
+    sampler = StackSampler(threading.get_ident(), interval)
+    sampler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        await asyncio.to_thread(sampler.stop)
+    return sampler.collapsed()
+
+
+async def profile_pstats(seconds: float) -> bytes:
+    """
+    Deterministic profile of the event loop thread, in the format read by pstats.Stats.
+    """
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profile.disable()
+    profile.create_stats()
+    return marshal.dumps(profile.stats)
+
+
+async def detect_slow_calls(seconds: float, threshold_ms: float) -> dict:
+    """
+    Traces every monitor tick, Binance call and /stats render for the window
+    and reports the ones slower than threshold_ms, together with event loop lag.
+    """
+    slow = []
+
+    def collect(trace: dict):
+        slow_spans = [span for span in trace["spans"] if span["duration_ms"] >= threshold_ms]
+        if trace["duration_ms"] >= threshold_ms or slow_spans:
+            slow.append({
+                "name": trace["name"],
+                "attrs": trace["attrs"],
+                "duration_ms": trace["duration_ms"],
+                "error": trace.get("error"),
+                "slow_spans": slow_spans,
+            })
+
+    lags = []
+    probe_interval = 0.05
+    deadline = time.perf_counter() + seconds
+    tracer.listeners.append(collect)
+    try:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            await asyncio.sleep(probe_interval)
+            lags.append((time.perf_counter() - started - probe_interval) * 1000)
+    finally:
+        tracer.listeners.remove(collect)
+
+    lags.sort()
+    return {
+        "seconds": seconds,
+        "threshold_ms": threshold_ms,
+        "loop_lag_ms": {
+            "max": lags[-1] if lags else None,
+            "p99": lags[int(len(lags) * 0.99)] if lags else None,
+            "mean": sum(lags) / len(lags) if lags else None,
+        },
+        "slow_calls": sorted(slow, key=lambda item: item["duration_ms"], reverse=True),
+    }
+
+
+def _await_chain(coro) -> list:
+    chain = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            # A future or other awaitable at the bottom of the chain
+            chain.append(type(coro).__name__)
+            break
+        chain.append(f"{_frame_name(frame)}:{frame.f_lineno}")
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return chain
+
+
+def dump_tasks() -> list:
+    """
+    Every pending asyncio task with the await chain it is suspended on.
+    """
+    tasks = []
+    for task in asyncio.all_tasks():
+        coro = task.get_coro()
+        tasks.append({
+            "name": task.get_name(),
+            "coro": getattr(coro, "__qualname__", repr(coro)),
+            "awaiting": _await_chain(coro),
+        })
+    return sorted(tasks, key=lambda item: item["name"])
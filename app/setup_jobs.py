@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SetupJob:
+    """
+    Progress of placing a new bot's grid in the background, polled by the setup page.
+    """
+
+    PLACING = "placing"
+    RUNNING = "running"
+    FAILED = "failed"
+
+    def __init__(self, bot_id: str, total_orders: int, market_price: float):
+        self.bot_id = bot_id
+        self.status = self.PLACING
+        self.total_orders = total_orders
+        self.placed_orders = 0
+        self.market_price = market_price
+        self.orders = []
+        self.message = "Выставление ордеров"
+        self.error = None
+        self.created_at = time.time()
+        self.task = None
+
+    @property
+    def active(self) -> bool:
+        """
+        True while the grid is still being placed.
+        """
+        return self.status == self.PLACING
+
+    def set_progress(self, placed: int, total: int):
+        self.placed_orders = placed
+        self.total_orders = total
+
+    def finish(self, orders: list):
+        self.status = self.RUNNING
+        self.orders = orders
+        self.message = "Сетка ордеров установлена, бот запущен"
+
+    def fail(self, error: str):
+        self.status = self.FAILED
+        self.error = error
+        self.message = "Ошибка запуска цикла"
+
+    async def stop(self, error: str):
+        """
+        Cancels a placement still in progress and marks the job failed, e.g. when the bot was stopped.
+        """
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        if self.status != self.FAILED:
+            self.fail(error)
+
+    def to_dict(self) -> dict:
+        return {
+            "bot_id": self.bot_id,
+            "status": self.status,
+            "message": self.message,
+            "error": self.error,
+            "market_price": self.market_price,
+            "placed_orders": self.placed_orders,
+            "total_orders": self.total_orders,
+            "orders": [
+                {
+                    "order_number": order["order_number"],
+                    "price": order["price"],
+                    "usdt_allocation": order["usdt_allocation"],
+                    "asset_quantity": order["asset_quantity"],
+                    "order_id": order.get("order_id"),
+                    "status": order.get("status"),
+                }
+                for order in self.orders
+            ],
+        }
+
+
+async def run_preflight(client, symbol: str) -> tuple:
+    """
+    Runs the independent setup checks concurrently: price and symbol filters alongside
+    clock sync followed by the USDT balance, which is signed with the synced clock.
+    If one check fails, the others are cancelled before this returns.
+    """
+    async def synced_balance() -> float:
+        await client.sync_time()
+        return await client.get_asset_balance("USDT")
+
+    try:
+        async with asyncio.TaskGroup() as group:
+            balance = group.create_task(synced_balance())
+            price_data = group.create_task(client.get_spot_price(symbol))
+            filters = group.create_task(client.get_symbol_filters(symbol))
+    except ExceptionGroup as eg:
+        # Report the first failed check rather than the group
+        raise eg.exceptions[0]
+    return balance.result(), float(price_data.result()["price"]), filters.result()
+
+
+async def place_grid_job(job: SetupJob, bot, grid_orders: list, bots: dict, coordinator):
+    """
+    Places the grid of a new bot registered in bots and starts its monitoring.
+    On failure the partial grid is cancelled, the bot is unregistered and its lease released.
+    """
+    try:
+        await bot.place_grid(grid_orders, on_progress=job.set_progress)
+    except Exception as e:
+        logger.error("Error placing grid for bot %s: %s", job.bot_id, e)
+        job.fail(str(e))
+        # Do not leave a partial grid on the exchange
+        await bot.cancel_all_orders()
+        # A bot that lost its lease was already removed, and its snapshot belongs to the new owner
+        if bots.get(job.bot_id) is bot:
+            bots.pop(job.bot_id)
+            await coordinator.forget(job.bot_id)
+        await bot.client.aclose()
+        return
+
+    if bots.get(job.bot_id) is not bot:
+        # The lease was lost during placement; the coordinator cancels the orders of dropped bots
+        job.fail("Бот остановлен: аренда бота потеряна")
+        return
+
+    # The grid is placed: from here on the bot runs, whatever happens to the snapshot
+    bot.start_monitoring()
+    job.finish(bot.current_grid_orders)
+    try:
+        await coordinator.publish(job.bot_id, bot)
+    except Exception as e:
+        # The coordinator republishes on its next lease renewal
+        logger.error("Error publishing snapshot for bot %s: %s", job.bot_id, e)
@@ -0,0 +1,137 @@
+import contextvars
+import functools
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class TraceExporter:
+    """
+    Appends finished traces to a JSON lines file from a background thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+        self._lock = threading.Lock()
+
+    def export(self, trace: dict):
+        if self.thread is None:
+            with self._lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self.thread.start()
+        self.queue.put(trace)
+
+    def stop(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def _run(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                trace = self.queue.get()
+                if trace is None:
+                    break
+                try:
+                    f.write(json.dumps(trace, default=str) + "\n")
+                    if self.queue.empty():
+                        f.flush()
+                except Exception:
+                    logger.exception("Error exporting trace")
+
+
+class Tracer:
+    """
+    Sampled per-tick traces. A trace groups the spans (API calls, fill handling, ...)
+    made while it is active; spans outside a sampled trace are no-ops.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, exporter: TraceExporter = None):
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        self.listeners = []
+
+    @contextmanager
+    def trace(self, name: str, **attrs):
+        # Listeners (e.g. the admin slow-call detector) see every trace while registered,
+        # the exporter only sees the sampled ones.
+        sampled = self.exporter is not None and self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled and not self.listeners:
+            yield None
+            return
+        trace = {"name": name, "start": time.time(), "attrs": attrs, "spans": []}
+        started = time.perf_counter()
+        token = _current_trace.set((trace, started))
+        try:
+            yield trace
+        except BaseException as e:
+            trace["error"] = repr(e)
+            raise
+        finally:
+            _current_trace.reset(token)
+            trace["duration_ms"] = (time.perf_counter() - started) * 1000
+            self._finish(trace, sampled)
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        current = _current_trace.get()
+        if current is None:
+            yield
+            return
+        trace, trace_started = current
+        started = time.perf_counter()
+        span = {"name": name, "offset_ms": (started - trace_started) * 1000}
+        if attrs:
+            span["attrs"] = attrs
+        try:
+            yield
+        except BaseException as e:
+            span["error"] = repr(e)
+            raise
+        finally:
+            span["duration_ms"] = (time.perf_counter() - started) * 1000
+            trace["spans"].append(span)
+
+    def _finish(self, trace: dict, sampled: bool):
+        if sampled:
+            self.exporter.export(trace)
+        for listener in self.listeners:
+            try:
+                listener(trace)
+            except Exception:
+                logger.exception("Error in trace listener")
+
+
+tracer = Tracer()
+
+
+def configure(sample_rate: float, path: str = None):
+    tracer.sample_rate = sample_rate
+    tracer.exporter = TraceExporter(path) if path else None
+
+
+def traced(name: str):
+    """
+    Decorator recording a coroutine call as a span of the current trace.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if _current_trace.get() is None:
+                return await func(*args, **kwargs)
+            with tracer.span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,17 +1,23 @@
 import asyncio
 import logging
 import math
+import time
 from app.binance import BinanceClient
 from app.calc import calculate_grid_orders
+from app.history import CycleHistory
+from app.tracing import tracer, traced
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
 
 MONITOR_INTERVAL = 2
+# Binance spot minimum order value; the symbol NOTIONAL filter may raise it
+MIN_ORDER_NOTIONAL = 5.0
 
 class TradingBot:
-    def __init__(self, api_key: str, api_secret: str, trading_pair: str, reposition_threshold_percent: float):
-        self.client = BinanceClient(api_key, api_secret)
+    def __init__(self, api_key: str, api_secret: str, trading_pair: str, reposition_threshold_percent: float, bot_id: str = None, client: BinanceClient = None, history: CycleHistory = None):
+        self.bot_id = bot_id
+        self.history = history
+        self.client = client if client is not None else BinanceClient(api_key, api_secret)
         self.symbol = trading_pair.replace("/", "")  # e.g. "BTC/USDT" -> "BTCUSDT"
         self.reposition_threshold_percent = reposition_threshold_percent
         self.current_grid_orders = []
@@ -23,6 +29,11 @@ class TradingBot:
         self.completed_cycles = 0
         self.total_profit_usdt = 0.0
         self.total_unsold_asset = 0.0
+        self.cycle_started_at = None
+        # Exchange filters for the symbol, by filter type (see BinanceClient.get_symbol_filters)
+        self.filters = {}
+        # Every record of this bot carries its symbol as a structured field
+        self.logger = logging.LoggerAdapter(logger, {"symbol": self.symbol})
 
     async def start_cycle(
         self,
@@ -33,6 +44,39 @@ class TradingBot:
         increase_percent: float,
         profit_percent: float
     ) -> dict:
+        price_data = await self.client.get_spot_price(self.symbol)
+        grid_orders = self.prepare_cycle(
+            market_price=float(price_data["price"]),
+            usdt_amount=usdt_amount,
+            grid_length_percent=grid_length_percent,
+            first_order_offset_percent=first_order_offset_percent,
+            num_grid_orders=num_grid_orders,
+            increase_percent=increase_percent,
+            profit_percent=profit_percent
+        )
+        await self.place_grid(grid_orders)
+        self.start_monitoring()
+        
+        return {
+            "message": "Сетка ордеров установлена, бот запущен",
+            "market_price": self.initial_market_price,
+            "placed_orders": self.current_grid_orders
+        }
+
+    def prepare_cycle(
+        self,
+        market_price: float,
+        usdt_amount: float,
+        grid_length_percent: float,
+        first_order_offset_percent: float,
+        num_grid_orders: int,
+        increase_percent: float,
+        profit_percent: float,
+        filters: dict = None
+    ) -> list:
+        """
+        Stores the cycle settings and computes the validated grid for market_price, without placing anything.
+        """
         self.config = {
             "usdt_amount": usdt_amount,
             "grid_length_percent": grid_length_percent,
@@ -41,26 +85,47 @@ class TradingBot:
             "increase_percent": increase_percent,
             "profit_percent": profit_percent
         }
-        price_data = await self.client.get_spot_price(self.symbol)
-        self.initial_market_price = float(price_data["price"])
-        
+        if filters is not None:
+            self.filters = filters
+        self.initial_market_price = market_price
+        return self._build_grid(market_price)
+
+    def _build_grid(self, market_price: float) -> list:
         asset = self.symbol.replace("USDT", "")
         grid_orders = calculate_grid_orders(
-            market_price=self.initial_market_price,
-            offset_percent=first_order_offset_percent,
-            grid_length_percent=grid_length_percent,
-            num_orders=num_grid_orders,
-            total_usdt=usdt_amount,
-            increase_percent=increase_percent,
+            market_price=market_price,
+            offset_percent=self.config["first_order_offset_percent"],
+            grid_length_percent=self.config["grid_length_percent"],
+            num_orders=self.config["num_grid_orders"],
+            total_usdt=self.config["usdt_amount"],
+            increase_percent=self.config["increase_percent"],
             asset=asset
         )
-        
-        self.current_grid_orders = []
+        self._validate_grid(grid_orders)
+        return grid_orders
+
+    def _validate_grid(self, grid_orders: list):
+        """
+        Checks every order against the symbol filters before any order is sent.
+        """
+        notional_filter = self.filters.get("NOTIONAL") or self.filters.get("MIN_NOTIONAL") or {}
+        min_notional = max(float(notional_filter.get("minNotional", 0)), MIN_ORDER_NOTIONAL)
+        min_qty = float(self.filters.get("LOT_SIZE", {}).get("minQty", 0))
         for order in grid_orders:
             volume = order["asset_quantity"] * order["price"]
-            if volume < 5:
-                raise ValueError(f"Объём каждого ордера должен быть не менее 5 USDT, вычисленный объём: {volume:.7f} USDT")
+            if volume < min_notional:
+                raise ValueError(f"Объём каждого ордера должен быть не менее {min_notional:g} USDT, вычисленный объём: {volume:.7f} USDT")
+            if order["asset_quantity"] < min_qty:
+                raise ValueError(f"Количество актива в ордере должно быть не менее {min_qty:g}, вычисленное количество: {order['asset_quantity']}")
 
+    async def place_grid(self, grid_orders: list, on_progress=None):
+        """
+        Places the grid buy orders one by one. Placed orders are added to
+        current_grid_orders right away, so cancel_all_orders can undo a partial grid.
+        on_progress(placed, total) is called after each order.
+        """
+        self.current_grid_orders = []
+        for order in grid_orders:
             res = await self.client.create_order(
                 symbol=self.symbol,
                 side="BUY",
@@ -72,88 +137,106 @@ class TradingBot:
             order["order_id"] = res.get("orderId")
             order["status"] = res.get("status")
             self.current_grid_orders.append(order)
-        
+            if on_progress is not None:
+                on_progress(len(self.current_grid_orders), len(grid_orders))
+
+    def start_monitoring(self):
         # Start asynchronous monitoring task if not already running
         if self.monitor_task is None or self.monitor_task.done():
-            self.monitor_task = asyncio.create_task(self.monitor_cycle())
-        
+            self.monitor_task = asyncio.create_task(self.monitor_cycle(), name=f"monitor:{self.bot_id or self.symbol}")
+
+    def snapshot(self) -> dict:
+        """
+        JSON-serializable view of the bot state, published to the coordination store.
+        """
         return {
-            "message": "Сетка ордеров установлена, бот запущен",
-            "market_price": self.initial_market_price,
-            "placed_orders": self.current_grid_orders
+            "bot_id": self.bot_id,
+            "symbol": self.symbol,
+            "config": self.config,
+            "reposition_threshold_percent": self.reposition_threshold_percent,
+            "cycle_started": self.cycle_started,
+            "completed_cycles": self.completed_cycles,
+            "total_profit_usdt": self.total_profit_usdt,
+            "total_unsold_asset": self.total_unsold_asset,
+            "filled_orders": len([order for order in self.current_grid_orders if order.get("status") == "FILLED"]),
+            "open_orders": len(self.current_grid_orders),
+            "fixing_order_price": self.fixing_order.get("price") if self.fixing_order else None,
         }
 
     async def monitor_cycle(self):
         while True:
             # Phase 1: Wait for cycle to start
             while not self.cycle_started:
-                for order in self.current_grid_orders:
-                    try:
-                        status = await self.client.get_order_status(self.symbol, order["order_id"])
-                        if status.get("status") == "FILLED":
-                            order["status"] = "FILLED"
-                            self.cycle_started = True
-                            logger.info(f"Cycle started: Order {order['order_id']} filled.")
-                            # Create fixing order immediately after first fill.
-                            await self.create_fixing_order(self.config["profit_percent"])
-                            break
-                    except Exception as e:
-                        logger.error(f"Error checking status for order {order['order_id']}: {e}")
-                if not self.cycle_started:
-                    try:
-                        price_data = await self.client.get_spot_price(self.symbol)
-                        current_price = float(price_data["price"])
-                        # Trigger price is based on the initial market price
-                        trigger_price = self.initial_market_price * (1 + self.reposition_threshold_percent / 100)
-                        if current_price >= trigger_price:
-                            logger.info(f"Repositioning grid: Current price {current_price} >= trigger price {trigger_price}.")
-                            await self.cancel_all_orders()
-                            await self._recreate_grid()
+                with tracer.trace("tick", bot_id=self.bot_id, symbol=self.symbol, phase="waiting"):
+                    for order in self.current_grid_orders:
+                        try:
+                            status = await self.client.get_order_status(self.symbol, order["order_id"])
+                            if status.get("status") == "FILLED":
+                                order["status"] = "FILLED"
+                                self.cycle_started = True
+                                self.cycle_started_at = time.time()
+                                self.logger.info("Cycle started: Order %s filled.", order["order_id"])
+                                # Create fixing order immediately after first fill.
+                                await self.create_fixing_order(self.config["profit_percent"])
+                                break
+                        except Exception as e:
+                            self.logger.error("Error checking status for order %s: %s", order["order_id"], e)
+                    if not self.cycle_started:
+                        try:
                             price_data = await self.client.get_spot_price(self.symbol)
-                            self.initial_market_price = float(price_data["price"])
-                    except Exception as e:
-                        logger.error(f"Error during reposition check: {e}")
+                            current_price = float(price_data["price"])
+                            # Trigger price is based on the initial market price
+                            trigger_price = self.initial_market_price * (1 + self.reposition_threshold_percent / 100)
+                            if current_price >= trigger_price:
+                                self.logger.info("Repositioning grid: Current price %s >= trigger price %s.", current_price, trigger_price)
+                                await self._recreate_grid()
+                                price_data = await self.client.get_spot_price(self.symbol)
+                                self.initial_market_price = float(price_data["price"])
+                        except Exception as e:
+                            self.logger.error("Error during reposition check: %s", e)
                 await asyncio.sleep(MONITOR_INTERVAL)
             
             # Phase 2: Cycle started – monitor the fixing order and additional fills.
             while self.cycle_started:
-                # Check fixing order status
-                if self.fixing_order is not None:
-                    try:
-                        status = await self.client.get_order_status(self.symbol, self.fixing_order["order_id"])
-                        if status.get("status") == "FILLED":
-                            # weighted_avg = self.fixing_order.get("weighted_avg_price", 0)
-                            # profit_usdt = (self.fixing_order["price"] - weighted_avg) * self.fixing_order["net_quantity"]
-                            fixing_order_income = await self.get_fixing_order_income()
-                            profit_usdt = fixing_order_income - self.fixing_order.get("total_sold_cost", 0)
-                            self.total_profit_usdt += profit_usdt
-                            self.total_unsold_asset += self.fixing_order["unsold_asset"]
-                            self.completed_cycles += 1
-                            logger.info(f"Fixing order {self.fixing_order['order_id']} filled. Cycle completed. Profit: {profit_usdt} USDT.")
-                            await self.cancel_all_orders()
-                            self.cycle_started = False
-                            break
-                    except Exception as e:
-                        logger.error(f"Error checking fixing order status: {e}")
+                with tracer.trace("tick", bot_id=self.bot_id, symbol=self.symbol, phase="cycle"):
+                    # Check fixing order status
+                    if self.fixing_order is not None:
+                        try:
+                            status = await self.client.get_order_status(self.symbol, self.fixing_order["order_id"])
+                            if status.get("status") == "FILLED":
+                                # weighted_avg = self.fixing_order.get("weighted_avg_price", 0)
+                                # profit_usdt = (self.fixing_order["price"] - weighted_avg) * self.fixing_order["net_quantity"]
+                                fixing_order_income = await self.get_fixing_order_income()
+                                profit_usdt = fixing_order_income - self.fixing_order.get("total_sold_cost", 0)
+                                self.total_profit_usdt += profit_usdt
+                                self.total_unsold_asset += self.fixing_order["unsold_asset"]
+                                self.completed_cycles += 1
+                                self.logger.info("Fixing order %s filled. Cycle completed. Profit: %s USDT.", self.fixing_order["order_id"], profit_usdt)
+                                await self.record_cycle(fixing_order_income, profit_usdt)
+                                await self.cancel_all_orders()
+                                self.cycle_started = False
+                                break
+                        except Exception as e:
+                            self.logger.error("Error checking fixing order status: %s", e)
                 
-                # Check for additional buy order fills and update fixing order if needed.
-                additional_fill = False
-                for order in self.current_grid_orders:
-                    try:
-                        status = await self.client.get_order_status(self.symbol, order["order_id"])
-                        if status.get("status") == "FILLED" and order.get("status") != "FILLED":
-                            order["status"] = "FILLED"
-                            additional_fill = True
-                    except Exception as e:
-                        logger.error(f"Error checking status for order {order['order_id']}: {e}")
-                if additional_fill:
-                    logger.info("Additional buy orders filled. Updating fixing order.")
-                    await self.update_fixing_order(self.config["profit_percent"])
+                    # Check for additional buy order fills and update fixing order if needed.
+                    additional_fill = False
+                    for order in self.current_grid_orders:
+                        try:
+                            status = await self.client.get_order_status(self.symbol, order["order_id"])
+                            if status.get("status") == "FILLED" and order.get("status") != "FILLED":
+                                order["status"] = "FILLED"
+                                additional_fill = True
+                        except Exception as e:
+                            self.logger.error("Error checking status for order %s: %s", order["order_id"], e)
+                    if additional_fill:
+                        self.logger.info("Additional buy orders filled. Updating fixing order.")
+                        await self.update_fixing_order(self.config["profit_percent"])
                 
                 await asyncio.sleep(MONITOR_INTERVAL)
             
             # Cycle completed – automatically start a new cycle using stored configuration.
-            logger.info("Cycle completed. Starting new cycle automatically.")
+            self.logger.info("Cycle completed. Starting new cycle automatically.")
             await self.start_cycle(
                 usdt_amount=self.config["usdt_amount"],
                 grid_length_percent=self.config["grid_length_percent"],
@@ -163,12 +246,39 @@ class TradingBot:
                 profit_percent=self.config["profit_percent"]
             )
 
+    @traced("bot.record_cycle")
+    async def record_cycle(self, income: float, profit_usdt: float):
+        """
+        Appends the just completed cycle to the cycle history, if one is configured.
+        """
+        if self.history is None:
+            return
+        ended_at = time.time()
+        cycle = {
+            "bot_id": self.bot_id or self.symbol,
+            "symbol": self.symbol,
+            "started_at": self.cycle_started_at or ended_at,
+            "ended_at": ended_at,
+            "fills": len([order for order in self.current_grid_orders if order.get("status") == "FILLED"]),
+            "avg_price": self.fixing_order.get("weighted_avg_price", 0.0),
+            "fixing_price": self.fixing_order["price"],
+            "income": income,
+            "commission": self.fixing_order.get("comission", 0.0),
+            "profit": profit_usdt,
+            "leftover_asset": self.fixing_order["unsold_asset"],
+        }
+        try:
+            await self.history.append(cycle)
+        except Exception as e:
+            self.logger.error("Error recording cycle history: %s", e)
+
+    @traced("bot.create_fixing_order")
     async def create_fixing_order(self, profit_percent: float) -> dict:
         asset = self.symbol.replace("USDT", "")  # e.g. "BTC" or "ETH"
         # Get orderIds for filled buy orders from the grid
         filled_order_ids = {order["order_id"] for order in self.current_grid_orders if order.get("status") == "FILLED"}
         if not filled_order_ids:
-            logger.info("No executed buy orders, fixing order not created.")
+            self.logger.info("No executed buy orders, fixing order not created.")
             return {}
 
         # Get trade history from Binance
@@ -186,7 +296,7 @@ class TradingBot:
         ]
         
         if not relevant_trades:
-            logger.info("No relevant trades found for filled orders, fixing order not created.")
+            self.logger.info("No relevant trades found for filled orders, fixing order not created.")
             return {}
         
         # Aggregate total quantity and total cost, and sum commission where commissionAsset equals the asset.
@@ -196,7 +306,7 @@ class TradingBot:
         
         net_qty_bought = total_qty - total_commission
         if net_qty_bought <= 0:
-            logger.error("Net quantity after commission is non-positive. Cannot create fixing order.")
+            self.logger.error("Net quantity after commission is non-positive. Cannot create fixing order.")
             return {}
         
         weighted_avg_price = total_cost / total_qty  # weighted average purchase price
@@ -229,9 +339,10 @@ class TradingBot:
             "weighted_avg_price": weighted_avg_price,
             "total_sold_cost": total_cost,
         }
-        logger.info(f"Created fixing order at price {sell_price} for quantity {net_qty_bought}")
+        self.logger.info("Created fixing order at price %s for quantity %s", sell_price, net_qty_bought)
         return res
 
+    @traced("bot.get_fixing_order_income")
     async def get_fixing_order_income(self) -> float:
         trades = await self.client.get_trade_history(self.symbol)
         self.fixing_order["comission"] = 0.0
@@ -242,6 +353,7 @@ class TradingBot:
                 self.fixing_order["quoteQty"] += float(trade.get("quoteQty", 0))
         return self.fixing_order["quoteQty"] - self.fixing_order["comission"]
 
+    @traced("bot.update_fixing_order")
     async def update_fixing_order(self, profit_percent: float) -> dict:
         """
         Cancels the current fixing order and creates a new one based on updated executed buy orders.
@@ -249,60 +361,42 @@ class TradingBot:
         if self.fixing_order is not None:
             try:
                 await self.client.cancel_order(self.symbol, self.fixing_order["order_id"])
-                logger.info(f"Cancelled fixing order {self.fixing_order['order_id']}")
+                self.logger.info("Cancelled fixing order %s", self.fixing_order["order_id"])
             except Exception as e:
-                logger.error(f"Error cancelling fixing order: {e}")
+                self.logger.error("Error cancelling fixing order: %s", e)
         # Create new fixing order with updated parameters
         return await self.create_fixing_order(profit_percent)
 
+    @traced("bot.recreate_grid")
     async def _recreate_grid(self):
-        await self.cancel_all_orders()
         price_data = await self.client.get_spot_price(self.symbol)
-        self.initial_market_price = float(price_data["price"])
-        logger.info(f"Recreating grid using new market price: {self.initial_market_price}")
-        
-        asset = self.symbol.replace("USDT", "")
-        grid_orders = calculate_grid_orders(
-            market_price=self.initial_market_price,
-            offset_percent=self.config["first_order_offset_percent"],
-            grid_length_percent=self.config["grid_length_percent"],
-            num_orders=self.config["num_grid_orders"],
-            total_usdt=self.config["usdt_amount"],
-            increase_percent=self.config["increase_percent"],
-            asset=asset
-        )
+        market_price = float(price_data["price"])
+        # Validate the new grid before touching the old one, so a rejected grid leaves the old one in place
+        grid_orders = self._build_grid(market_price)
+        await self.cancel_all_orders()
+        self.initial_market_price = market_price
+        self.logger.info("Recreating grid using new market price: %s", self.initial_market_price)
         
-        self.current_grid_orders = []
-        for order in grid_orders:
-            res = await self.client.create_order(
-                symbol=self.symbol,
-                side="BUY",
-                order_type="LIMIT",
-                quantity=order["asset_quantity"],
-                price=order["price"],
-                timeInForce="GTC"
-            )
-            order["order_id"] = res.get("orderId")
-            order["status"] = res.get("status")
-            self.current_grid_orders.append(order)
-        logger.info("New grid orders placed.")
+        await self.place_grid(grid_orders)
+        self.logger.info("New grid orders placed.")
         # Reset fixing order
         self.fixing_order = None
 
+    @traced("bot.cancel_all_orders")
     async def cancel_all_orders(self):
         """Cancels all currently placed buy orders and the fixing order if it exists."""
         for order in self.current_grid_orders:
             order_id = order.get("order_id")
             try:
                 await self.client.cancel_order(self.symbol, order_id)
-                logger.info(f"Cancelled buy order {order_id}")
+                self.logger.info("Cancelled buy order %s", order_id)
             except Exception as e:
-                logger.error(f"Error cancelling buy order {order_id}: {e}")
+                self.logger.error("Error cancelling buy order %s: %s", order_id, e)
         self.current_grid_orders = []
         if self.fixing_order:
             try:
                 await self.client.cancel_order(self.symbol, self.fixing_order["order_id"])
-                logger.info(f"Cancelled fixing order {self.fixing_order['order_id']}")
+                self.logger.info("Cancelled fixing order %s", self.fixing_order["order_id"])
             except Exception as e:
-                logger.error(f"Error cancelling fixing order: {e}")
+                self.logger.error("Error cancelling fixing order: %s", e)
             self.fixing_order = None
@@ -0,0 +1,197 @@
+import asyncio
+import time
+
+import pytest
+
+from app.coordination import HashRing, InMemoryStore, ShardCoordinator, SQLiteStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteStore(str(tmp_path / "shards.sqlite3"))
+    return InMemoryStore()
+
+
+def test_lease_refused_to_another_owner(store):
+    async def scenario():
+        assert await store.acquire_lease("bot", "w1", 10)
+        assert not await store.acquire_lease("bot", "w2", 10)
+        assert await store.get_lease_owner("bot") == "w1"
+    asyncio.run(scenario())
+
+
+def test_lease_renewed_by_owner(store):
+    async def scenario():
+        assert await store.acquire_lease("bot", "w1", 0.2)
+        await asyncio.sleep(0.1)
+        assert await store.acquire_lease("bot", "w1", 0.2)
+        await asyncio.sleep(0.15)
+        # Still held thanks to the renewal
+        assert not await store.acquire_lease("bot", "w2", 10)
+    asyncio.run(scenario())
+
+
+def test_expired_lease_can_be_taken(store):
+    async def scenario():
+        assert await store.acquire_lease("bot", "w1", 0.05)
+        await asyncio.sleep(0.1)
+        assert await store.get_lease_owner("bot") is None
+        assert await store.acquire_lease("bot", "w2", 10)
+        assert await store.get_lease_owner("bot") == "w2"
+    asyncio.run(scenario())
+
+
+def test_release_only_by_owner(store):
+    async def scenario():
+        await store.acquire_lease("bot", "w1", 10)
+        await store.release_lease("bot", "w2")
+        assert await store.get_lease_owner("bot") == "w1"
+        await store.release_lease("bot", "w1")
+        assert await store.get_lease_owner("bot") is None
+    asyncio.run(scenario())
+
+
+def test_live_workers_skip_expired_heartbeats(store):
+    async def scenario():
+        await store.heartbeat("w1", "http://w1", 10)
+        await store.heartbeat("w2", "http://w2", 0.05)
+        await asyncio.sleep(0.1)
+        assert await store.live_workers() == {"w1": "http://w1"}
+    asyncio.run(scenario())
+
+
+def test_hash_ring_is_stable():
+    keys = [f"BTCUSDT-{i}" for i in range(500)]
+    ring = HashRing(["w1", "w2", "w3"])
+    assignment = {key: ring.get_node(key) for key in keys}
+
+    assert HashRing(["w3", "w1", "w2"]).get_node(keys[0]) == assignment[keys[0]]
+    assert set(assignment.values()) == {"w1", "w2", "w3"}
+
+    # Adding a worker only moves keys onto the new worker
+    grown = HashRing(["w1", "w2", "w3", "w4"])
+    for key in keys:
+        node = grown.get_node(key)
+        assert node == assignment[key] or node == "w4"
+
+
+def test_hash_ring_empty():
+    assert HashRing().get_node("bot") is None
+
+
+class FakeClient:
+    def __init__(self):
+        self.closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+
+class FakeBot:
+    def __init__(self):
+        self.monitor_task = None
+        self.client = FakeClient()
+        self.orders_cancelled = False
+
+    def snapshot(self) -> dict:
+        return {"symbol": "BTCUSDT"}
+
+    async def cancel_all_orders(self):
+        self.orders_cancelled = True
+
+
+def test_bot_stopped_when_lease_taken_by_another_worker():
+    async def scenario():
+        store = InMemoryStore()
+        bots = {}
+        coordinator = ShardCoordinator(store, "w1", "http://w1", bots, lease_ttl=10)
+        bot = FakeBot()
+        bot.monitor_task = asyncio.create_task(asyncio.sleep(60))
+        bots["bot"] = bot
+        # Another worker holds the lease, e.g. after this worker's lease expired
+        await store.acquire_lease("bot", "w2", 10)
+
+        await coordinator._renew("bot", bot)
+        await asyncio.gather(*coordinator._shutdowns)
+
+        assert "bot" not in bots
+        assert bot.monitor_task.cancelled()
+        assert await store.get_snapshot("bot") is None
+    asyncio.run(scenario())
+
+
+def test_dropped_bot_orders_cancelled():
+    async def scenario():
+        store = InMemoryStore()
+        bot = FakeBot()
+        bots = {"bot": bot}
+        coordinator = ShardCoordinator(store, "w1", "http://w1", bots, lease_ttl=10)
+        await store.acquire_lease("bot", "w2", 10)
+
+        await coordinator._renew("bot", bot)
+        await asyncio.gather(*coordinator._shutdowns)
+
+        assert bot.orders_cancelled
+        assert bot.client.closed
+    asyncio.run(scenario())
+
+
+def test_bot_dropped_after_store_outage_longer_than_ttl():
+    class BrokenStore(InMemoryStore):
+        async def acquire_lease(self, key, owner, ttl):
+            raise ConnectionError("store unreachable")
+
+    async def scenario():
+        bot = FakeBot()
+        bots = {"bot": bot}
+        coordinator = ShardCoordinator(BrokenStore(), "w1", "http://w1", bots, lease_ttl=10)
+        coordinator._renewed_at["bot"] = time.time() - 5
+
+        await coordinator._renew("bot", bot)
+        assert "bot" in bots
+
+        coordinator._renewed_at["bot"] = time.time() - 11
+        await coordinator._renew("bot", bot)
+        await asyncio.gather(*coordinator._shutdowns)
+
+        assert "bot" not in bots
+        assert bot.orders_cancelled
+    asyncio.run(scenario())
+
+
+def test_renew_publishes_snapshot():
+    async def scenario():
+        store = InMemoryStore()
+        bot = FakeBot()
+        bots = {"bot": bot}
+        coordinator = ShardCoordinator(store, "w1", "http://w1", bots, lease_ttl=10)
+
+        await coordinator._renew("bot", bot)
+
+        assert "bot" in bots
+        assert (await store.get_snapshot("bot"))["worker_id"] == "w1"
+    asyncio.run(scenario())
+
+
+def test_owner_of_ignores_lease_of_dead_worker():
+    async def scenario():
+        store = InMemoryStore()
+        coordinator = ShardCoordinator(store, "w1", "http://w1", {}, lease_ttl=10)
+        await store.heartbeat("w1", "http://w1", 10)
+        await store.acquire_lease("bot", "dead", 10)
+
+        assert await coordinator.owner_of("bot") == ("w1", "http://w1")
+    asyncio.run(scenario())
+
+
+def test_live_snapshots_skip_dead_workers():
+    async def scenario():
+        store = InMemoryStore()
+        coordinator = ShardCoordinator(store, "w1", "http://w1", {}, lease_ttl=10)
+        await store.heartbeat("w1", "http://w1", 10)
+        await store.put_snapshot("alive", {"worker_id": "w1", "updated_at": time.time()})
+        await store.put_snapshot("stale", {"worker_id": "dead", "updated_at": time.time()})
+
+        assert list(await coordinator.live_snapshots()) == ["alive"]
+    asyncio.run(scenario())
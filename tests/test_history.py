@@ -0,0 +1,108 @@
+import asyncio
+import calendar
+
+import pytest
+
+from app.history import CycleHistory, day_range, normalize_day
+
+
+def ts(day: str, hour: int = 12) -> float:
+    return calendar.timegm((int(day[:4]), int(day[5:7]), int(day[8:10]), hour, 0, 0))
+
+
+def make_cycle(ended_at: float, bot_id: str = "bot", duration: float = 600, fills: int = 2, profit: float = 1.0) -> dict:
+    return {
+        "bot_id": bot_id,
+        "symbol": "BTCUSDT",
+        "started_at": ended_at - duration,
+        "ended_at": ended_at,
+        "fills": fills,
+        "avg_price": 100.0,
+        "fixing_price": 101.0,
+        "income": 10.0 + profit,
+        "commission": 0.01,
+        "profit": profit,
+        "leftover_asset": 0.00001,
+    }
+
+
+@pytest.fixture
+def history(tmp_path):
+    return CycleHistory(str(tmp_path / "history.sqlite3"))
+
+
+def test_rollup_aggregates_cycles_per_day(history):
+    async def scenario():
+        await history.append(make_cycle(ts("2026-10-01", 8), duration=600, fills=1, profit=1.0))
+        await history.append(make_cycle(ts("2026-10-01", 20), duration=1200, fills=3, profit=2.0))
+        await history.append(make_cycle(ts("2026-10-02"), duration=300, fills=2, profit=-0.5))
+        await history.append(make_cycle(ts("2026-10-01"), bot_id="other", profit=100.0))
+        return await history.daily("bot")
+
+    daily = asyncio.run(scenario())
+
+    assert [row["day"] for row in daily] == ["2026-10-01", "2026-10-02"]
+    first = daily[0]
+    assert first["cycles"] == 2
+    assert first["fills"] == 4
+    assert first["profit"] == pytest.approx(3.0)
+    assert first["duration_sum"] == pytest.approx(1800)
+    assert daily[1]["profit"] == pytest.approx(-0.5)
+
+
+def test_summary_over_range(history):
+    async def scenario():
+        for day in ("2026-09-30", "2026-10-01", "2026-10-01", "2026-10-05"):
+            await history.append(make_cycle(ts(day), duration=600, fills=2, profit=1.0))
+        return (
+            await history.summary("bot"),
+            await history.summary("bot", "2026-10-01", "2026-10-31"),
+            await history.summary("bot", end_day="2026-09-30"),
+        )
+
+    total, october, september = asyncio.run(scenario())
+
+    assert total["cycles"] == 4
+    assert total["active_days"] == 3
+    assert total["avg_cycle_duration"] == pytest.approx(600)
+    assert total["avg_fills_per_cycle"] == pytest.approx(2)
+    assert october["cycles"] == 3
+    assert october["profit"] == pytest.approx(3.0)
+    assert october["profit_per_active_day"] == pytest.approx(1.5)
+    assert september["cycles"] == 1
+
+
+def test_summary_of_unknown_bot_is_empty(history):
+    summary = asyncio.run(history.summary("missing"))
+
+    assert summary["cycles"] == 0
+    assert summary["profit"] == 0.0
+    assert summary["avg_cycle_duration"] is None
+    assert summary["profit_per_active_day"] is None
+
+
+def test_cycles_filtered_by_time_range(history):
+    async def scenario():
+        for day in ("2026-10-01", "2026-10-02", "2026-10-03"):
+            await history.append(make_cycle(ts(day)))
+        start, end = day_range("2026-10-02", "2026-10-02")
+        return await history.cycles("bot", start, end), await history.cycles("bot", limit=2)
+
+    in_range, limited = asyncio.run(scenario())
+
+    assert [cycle["ended_at"] for cycle in in_range] == [ts("2026-10-02")]
+    # Newest first
+    assert [cycle["ended_at"] for cycle in limited] == [ts("2026-10-03"), ts("2026-10-02")]
+
+
+def test_day_range_bounds():
+    assert day_range("2026-10-01", "2026-10-01") == (ts("2026-10-01", 0), ts("2026-10-02", 0))
+    assert day_range() == (0, None)
+
+
+def test_normalize_day():
+    assert normalize_day("2026-9-30") == "2026-09-30"
+    with pytest.raises(ValueError):
+        normalize_day("2026-13-01")
+    with pytest.raises(ValueError):
+        normalize_day("yesterday")
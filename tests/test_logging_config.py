@@ -0,0 +1,64 @@
+import json
+import logging
+import queue
+
+import pytest
+
+from app.logging_config import JsonFormatter, LazyQueueHandler, setup_logging
+
+
+@pytest.fixture
+def root_logger():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield root
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def make_record(msg: str, args, **extra) -> logging.LogRecord:
+    return logging.getLogger("test").makeRecord("test", logging.INFO, __file__, 1, msg, args, None, extra=extra)
+
+
+def test_queued_record_keeps_args_at_log_time():
+    log_queue = queue.SimpleQueue()
+    handler = LazyQueueHandler(log_queue)
+    orders = [1, 2]
+    state = {"status": "NEW"}
+
+    handler.handle(make_record("orders %s in %s", (orders, state)))
+    handler.handle(make_record("status %(status)s", (state,)))
+    orders.append(3)
+    state["status"] = "FILLED"
+
+    assert log_queue.get().getMessage() == "orders [1, 2] in {'status': 'NEW'}"
+    assert log_queue.get().getMessage() == "status NEW"
+
+
+def test_json_formatter_includes_extra_fields():
+    record = make_record("placed %d orders", (3,), symbol="BTCUSDT", bot_id="bot")
+
+    data = json.loads(JsonFormatter().format(record))
+
+    assert data["message"] == "placed 3 orders"
+    assert data["level"] == "INFO"
+    assert data["symbol"] == "BTCUSDT"
+    assert data["bot_id"] == "bot"
+    assert "args" not in data and "msg" not in data
+
+
+def test_unknown_level_falls_back_to_info(root_logger, capsys):
+    listener = setup_logging(level="verbose")
+    listener.stop()
+
+    assert root_logger.level == logging.INFO
+    assert "Unknown log level 'verbose', using INFO" in capsys.readouterr().err
+
+
+def test_level_name_is_case_insensitive(root_logger):
+    setup_logging(level="debug").stop()
+
+    assert root_logger.level == logging.DEBUG
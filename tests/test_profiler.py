@@ -0,0 +1,60 @@
+import asyncio
+import pstats
+
+from app import profiler
+
+
+def test_profile_pstats_loads(tmp_path):
+    async def busy():
+        for _ in range(5):
+            sum(range(10000))
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        task = asyncio.create_task(busy())
+        data = await profiler.profile_pstats(0.1)
+        await task
+        return data
+
+    path = tmp_path / "worker.prof"
+    path.write_bytes(asyncio.run(scenario()))
+
+    stats = pstats.Stats(str(path))
+    assert any(func[2] == "busy" for func in stats.stats)
+
+
+def test_sample_stacks_returns_collapsed_lines():
+    collapsed = asyncio.run(profiler.sample_stacks(0.1, 0.005))
+
+    lines = collapsed.splitlines()
+    assert lines
+    for line in lines:
+        # flamegraph.pl and speedscope split on the last space; frame names may contain spaces
+        stack, count = line.rsplit(" ", 1)
+        assert count.isdigit(), line
+    assert any("BaseEventLoop.run_forever" in line for line in lines)
+
+
+def test_dump_tasks_shows_monitor_await_chain():
+    async def wait_for_fill():
+        await asyncio.sleep(60)
+
+    async def monitor_cycle():
+        await wait_for_fill()
+
+    async def scenario():
+        task = asyncio.create_task(monitor_cycle(), name="monitor:bot")
+        await asyncio.sleep(0)
+        try:
+            return profiler.dump_tasks()
+        finally:
+            task.cancel()
+
+    tasks = {task["name"]: task for task in asyncio.run(scenario())}
+
+    monitor = tasks["monitor:bot"]
+    assert monitor["coro"].endswith("monitor_cycle")
+    assert [step.split(":")[1] for step in monitor["awaiting"][:2]] == [
+        "test_dump_tasks_shows_monitor_await_chain.<locals>.monitor_cycle",
+        "test_dump_tasks_shows_monitor_await_chain.<locals>.wait_for_fill",
+    ]
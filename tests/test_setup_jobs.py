@@ -0,0 +1,184 @@
+import asyncio
+
+import pytest
+
+from app.coordination import InMemoryStore, ShardCoordinator
+from app.setup_jobs import SetupJob, place_grid_job, run_preflight
+
+
+class FakeClient:
+    """
+    Records the Binance calls it receives; create_order fails from the fail_on-th order on.
+    """
+
+    def __init__(self, fail_on: int = None, price_error: Exception = None):
+        self.calls = []
+        self.cancelled = []
+        self.fail_on = fail_on
+        self.price_error = price_error
+        self.closed = False
+        self.sync_cancelled = False
+
+    async def sync_time(self):
+        self.calls.append("sync_time")
+        try:
+            await asyncio.sleep(0.01)
+        except asyncio.CancelledError:
+            self.sync_cancelled = True
+            raise
+        self.calls.append("sync_time done")
+
+    async def get_asset_balance(self, asset: str) -> float:
+        self.calls.append("balance")
+        return 1000.0
+
+    async def get_spot_price(self, symbol: str) -> dict:
+        self.calls.append("price")
+        if self.price_error is not None:
+            raise self.price_error
+        return {"price": "100.5"}
+
+    async def get_symbol_filters(self, symbol: str) -> dict:
+        self.calls.append("filters")
+        return {"LOT_SIZE": {"minQty": "0.001"}}
+
+    async def create_order(self, **params) -> dict:
+        order_id = len([call for call in self.calls if call == "create_order"]) + 1
+        self.calls.append("create_order")
+        if self.fail_on is not None and order_id >= self.fail_on:
+            raise RuntimeError("insufficient balance")
+        return {"orderId": order_id, "status": "NEW"}
+
+    async def cancel_order(self, symbol: str, order_id: int):
+        self.cancelled.append(order_id)
+
+    async def aclose(self):
+        self.closed = True
+
+
+class FakeBot:
+    """
+    The part of TradingBot used by place_grid_job.
+    """
+
+    def __init__(self, client: FakeClient):
+        self.client = client
+        self.current_grid_orders = []
+        self.monitor_task = None
+        self.monitoring = False
+
+    async def place_grid(self, grid_orders: list, on_progress=None):
+        self.current_grid_orders = []
+        for order in grid_orders:
+            res = await self.client.create_order(price=order["price"])
+            order["order_id"] = res["orderId"]
+            self.current_grid_orders.append(order)
+            if on_progress is not None:
+                on_progress(len(self.current_grid_orders), len(grid_orders))
+
+    async def cancel_all_orders(self):
+        for order in self.current_grid_orders:
+            await self.client.cancel_order("BTCUSDT", order["order_id"])
+        self.current_grid_orders = []
+
+    def start_monitoring(self):
+        self.monitoring = True
+
+    def snapshot(self) -> dict:
+        return {"symbol": "BTCUSDT"}
+
+
+def make_grid(count: int) -> list:
+    return [{"order_number": i + 1, "price": 100.0 - i} for i in range(count)]
+
+
+def test_preflight_syncs_clock_before_balance():
+    client = FakeClient()
+
+    balance, price, filters = asyncio.run(run_preflight(client, "BTCUSDT"))
+
+    assert (balance, price) == (1000.0, 100.5)
+    assert filters == {"LOT_SIZE": {"minQty": "0.001"}}
+    assert client.calls.index("sync_time done") < client.calls.index("balance")
+
+
+def test_preflight_failure_cancels_other_checks():
+    client = FakeClient(price_error=ValueError("unknown symbol"))
+
+    with pytest.raises(ValueError, match="unknown symbol"):
+        asyncio.run(run_preflight(client, "BTCUSDT"))
+
+    assert client.sync_cancelled
+    assert "balance" not in client.calls
+
+
+def test_failed_placement_cancels_partial_grid_and_releases_lease():
+    async def scenario():
+        store = InMemoryStore()
+        client = FakeClient(fail_on=3)
+        bot = FakeBot(client)
+        bots = {"bot": bot}
+        coordinator = ShardCoordinator(store, "w1", "http://w1", bots, lease_ttl=10)
+        await coordinator.acquire("bot")
+        job = SetupJob("bot", 4, 100.0)
+
+        await place_grid_job(job, bot, make_grid(4), bots, coordinator)
+
+        return store, bots, client, job
+
+    store, bots, client, job = asyncio.run(scenario())
+
+    assert client.cancelled == [1, 2]
+    assert client.closed
+    assert "bot" not in bots
+    assert asyncio.run(store.get_lease_owner("bot")) is None
+    assert job.status == SetupJob.FAILED
+    assert not job.active
+
+
+def test_placed_grid_starts_monitoring():
+    async def scenario():
+        store = InMemoryStore()
+        bot = FakeBot(FakeClient())
+        bots = {"bot": bot}
+        coordinator = ShardCoordinator(store, "w1", "http://w1", bots, lease_ttl=10)
+        await coordinator.acquire("bot")
+        job = SetupJob("bot", 3, 100.0)
+
+        await place_grid_job(job, bot, make_grid(3), bots, coordinator)
+
+        return store, bot, job
+
+    store, bot, job = asyncio.run(scenario())
+
+    assert bot.monitoring
+    assert job.status == SetupJob.RUNNING
+    assert job.placed_orders == 3
+    assert not job.active
+
+
+def test_dropped_bot_job_is_failed():
+    async def scenario():
+        store = InMemoryStore()
+        client = FakeClient()
+        bot = FakeBot(client)
+        bots = {"bot": bot}
+        job = SetupJob("bot", 3, 100.0)
+        job.finish([])
+
+        async def on_drop(bot_id: str):
+            await job.stop("Бот остановлен")
+
+        coordinator = ShardCoordinator(store, "w1", "http://w1", bots, lease_ttl=10, on_drop=on_drop)
+        await store.acquire_lease("bot", "w2", 10)
+
+        await coordinator._renew("bot", bot)
+        await asyncio.gather(*coordinator._shutdowns)
+
+        return job, client
+
+    job, client = asyncio.run(scenario())
+
+    assert job.status == SetupJob.FAILED
+    assert job.error == "Бот остановлен"
+    assert client.closed
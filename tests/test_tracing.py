@@ -0,0 +1,88 @@
+import asyncio
+
+from app.tracing import Tracer, traced
+
+
+class ListExporter:
+    def __init__(self):
+        self.traces = []
+
+    def export(self, trace: dict):
+        self.traces.append(trace)
+
+
+def test_unsampled_traces_are_not_exported():
+    exporter = ListExporter()
+    tracer = Tracer(sample_rate=0.0, exporter=exporter)
+
+    with tracer.trace("tick") as trace:
+        with tracer.span("api"):
+            pass
+
+    assert trace is None
+    assert exporter.traces == []
+
+
+def test_sampled_trace_records_spans():
+    exporter = ListExporter()
+    tracer = Tracer(sample_rate=1.0, exporter=exporter)
+
+    with tracer.trace("tick", symbol="BTCUSDT"):
+        with tracer.span("api", path="/api/v3/order"):
+            pass
+
+    [trace] = exporter.traces
+    assert trace["name"] == "tick"
+    assert trace["attrs"] == {"symbol": "BTCUSDT"}
+    assert [span["name"] for span in trace["spans"]] == ["api"]
+    assert trace["spans"][0]["attrs"] == {"path": "/api/v3/order"}
+    assert trace["duration_ms"] >= 0
+
+
+def test_spans_go_to_the_trace_of_their_task():
+    exporter = ListExporter()
+    tracer = Tracer(sample_rate=1.0, exporter=exporter)
+
+    async def tick(name: str, delay: float):
+        with tracer.trace(name):
+            for _ in range(2):
+                with tracer.span(f"{name}.call"):
+                    await asyncio.sleep(delay)
+
+    async def scenario():
+        await asyncio.gather(tick("a", 0.01), tick("b", 0.005))
+
+    asyncio.run(scenario())
+
+    assert len(exporter.traces) == 2
+    for trace in exporter.traces:
+        assert [span["name"] for span in trace["spans"]] == [f"{trace['name']}.call"] * 2
+
+
+def test_no_spans_outside_a_trace():
+    exporter = ListExporter()
+    tracer = Tracer(sample_rate=1.0, exporter=exporter)
+    calls = []
+
+    @traced("call")
+    async def call():
+        calls.append(1)
+        return 42
+
+    with tracer.span("orphan"):
+        pass
+    assert asyncio.run(call()) == 42
+
+    assert calls == [1]
+    assert exporter.traces == []
+
+
+def test_listeners_see_unsampled_traces():
+    tracer = Tracer(sample_rate=0.0)
+    seen = []
+    tracer.listeners.append(seen.append)
+
+    with tracer.trace("tick"):
+        pass
+
+    assert [trace["name"] for trace in seen] == ["tick"]
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+# app.trading_bot imports the Binance client, which needs httpx
+pytest.importorskip("httpx")
+
+from app.trading_bot import TradingBot  # noqa: E402
+
+
+class FakeClient:
+    def __init__(self, price: float):
+        self.price = price
+        self.cancelled = []
+        self.created = []
+
+    async def get_spot_price(self, symbol: str) -> dict:
+        return {"price": str(self.price)}
+
+    async def create_order(self, **params) -> dict:
+        self.created.append(params)
+        return {"orderId": 100 + len(self.created), "status": "NEW"}
+
+    async def cancel_order(self, symbol: str, order_id: int):
+        self.cancelled.append(order_id)
+
+
+def make_bot(filters: dict, usdt_amount: float = 100.0, price: float = 100.0):
+    bot = TradingBot("key", "secret", "BTC/USDT", 1.0, bot_id="bot", client=FakeClient(price))
+    grid = bot.prepare_cycle(
+        market_price=price,
+        usdt_amount=usdt_amount,
+        grid_length_percent=10,
+        first_order_offset_percent=1,
+        num_grid_orders=4,
+        increase_percent=0,
+        profit_percent=1,
+        filters=filters,
+    )
+    return bot, grid
+
+
+def test_grid_within_filters_is_accepted():
+    _, grid = make_bot({"NOTIONAL": {"minNotional": "5"}, "LOT_SIZE": {"minQty": "0.001"}})
+
+    assert len(grid) == 4
+
+
+@pytest.mark.parametrize("filter_type", ["NOTIONAL", "MIN_NOTIONAL"])
+def test_grid_below_min_notional_is_rejected(filter_type):
+    with pytest.raises(ValueError, match="не менее 30 USDT"):
+        make_bot({filter_type: {"minNotional": "30"}})
+
+
+def test_grid_below_lot_size_is_rejected():
+    with pytest.raises(ValueError, match="Количество актива"):
+        make_bot({"LOT_SIZE": {"minQty": "1"}})
+
+
+def test_rejected_reposition_keeps_old_grid():
+    async def scenario():
+        bot, grid = make_bot({"NOTIONAL": {"minNotional": "5"}})
+        await bot.place_grid(grid)
+        old_grid = list(bot.current_grid_orders)
+        # The new grid is rejected by a raised minimum notional
+        bot.filters = {"NOTIONAL": {"minNotional": "1000"}}
+        bot.client.price = 120.0
+
+        with pytest.raises(ValueError):
+            await bot._recreate_grid()
+
+        return bot, old_grid
+
+    bot, old_grid = asyncio.run(scenario())
+
+    assert bot.current_grid_orders == old_grid
+    assert bot.client.cancelled == []
+    assert bot.initial_market_price == 100.0